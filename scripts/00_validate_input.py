@@ -1,34 +1,166 @@
 import argparse
+import json
 import os
 import sys
+from collections import Counter
+
+import numpy as np
 import pandas as pd
 import yaml
 
+from axis_scoring import stable_text_hash
+from embedding_pipeline import clean_texts
+
+# Upper edges (characters, exclusive) of the length histogram buckets; the last bucket is open-ended.
+LENGTH_BIN_EDGES = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
 def load_cfg(path: str) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
+
+def length_summary(counts: np.ndarray) -> dict:
+    """Histogram and quantiles from `counts[L]` = number of texts with exactly L characters."""
+    n = int(counts.sum())
+    lengths = np.arange(len(counts))
+    hist = []
+    lo = 0
+    for hi in (*LENGTH_BIN_EDGES, None):
+        c = int(counts[lo:hi].sum()) if lo < len(counts) else 0
+        hist.append({"min_chars": lo, "max_chars": None if hi is None else hi - 1, "rows": c})
+        lo = hi
+    if n == 0:
+        return {"rows": 0, "histogram": hist}
+    cum = np.cumsum(counts)
+
+    def q(p: float) -> int:
+        return int(np.searchsorted(cum, p * n, side="left"))
+
+    return {
+        "rows": n,
+        "total_chars": int((lengths * counts).sum()),
+        "min": int(np.flatnonzero(counts)[0]),
+        "max": int(np.flatnonzero(counts)[-1]),
+        "mean": float((lengths * counts).sum() / n),
+        "p50": q(0.5),
+        "p90": q(0.9),
+        "p99": q(0.99),
+        "histogram": hist,
+    }
+
+
+def _add_lengths(counts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    add = np.bincount(lengths, minlength=len(counts))
+    if len(add) > len(counts):
+        counts = np.pad(counts, (0, len(add) - len(counts)))
+    counts[: len(add)] += add
+    return counts
+
+
+def validate_streaming(input_csv: str, text_col: str, group_cols: list[str], chunk_rows: int) -> dict:
+    """One pass over the CSV in chunks, reading only the text and group columns.
+
+    "empty" and the embedded rows follow 01_embed's filter (cleaned length > 0; depending on the pandas
+    version nulls count as empty), and duplicates are counted by stable_text_hash of the cleaned text,
+    i.e. the embedding cache key: `unique_texts` is the number of vectors a cold cache has to encode.
+    """
+    header = list(pd.read_csv(input_csv, nrows=0).columns)
+    if text_col not in header:
+        print(f"[ERROR] required text_column '{text_col}' not found. columns={header}", file=sys.stderr)
+        sys.exit(1)
+    groups = [c for c in group_cols if c in header and c != text_col]
+
+    n_rows = n_null = n_empty = 0
+    seen: set[bytes] = set()
+    dup_hashes: set[bytes] = set()
+    n_dup_rows = 0
+    all_counts = np.zeros(1024, dtype=np.int64)
+    unique_counts = np.zeros(1024, dtype=np.int64)
+    group_counts = {c: Counter() for c in groups}
+
+    for chunk in pd.read_csv(input_csv, usecols=[text_col, *groups], chunksize=chunk_rows):
+        n_rows += len(chunk)
+        n_null += int(chunk[text_col].isna().sum())
+        cleaned = clean_texts(chunk[text_col])
+        lengths = cleaned.str.len().fillna(0).to_numpy(dtype=np.int64)
+        keep = lengths > 0
+        n_empty += int((~keep).sum())
+        all_counts = _add_lengths(all_counts, lengths[keep])
+
+        new_lengths = []
+        for text, length in zip(cleaned[keep].tolist(), lengths[keep].tolist()):
+            h = bytes.fromhex(stable_text_hash(text))
+            if h in seen:
+                n_dup_rows += 1
+                dup_hashes.add(h)
+            else:
+                seen.add(h)
+                new_lengths.append(length)
+        unique_counts = _add_lengths(unique_counts, np.asarray(new_lengths, dtype=np.int64))
+
+        for c in groups:
+            group_counts[c].update(chunk[c].fillna("NA").astype(str).tolist())
+
+    return {
+        "input_csv": input_csv,
+        "text_column": text_col,
+        "rows": n_rows,
+        "null_text": n_null,
+        "empty_after_cleaning": n_empty,
+        "rows_embedded": n_rows - n_empty,
+        "unique_texts": len(seen),
+        "duplicate_rows": n_dup_rows,
+        "duplicate_texts": len(dup_hashes),
+        "length_chars": length_summary(all_counts),
+        "unique_length_chars": length_summary(unique_counts),
+        "group_counts": {c: dict(group_counts[c].most_common()) for c in groups},
+        "missing_group_columns": [c for c in group_cols if c not in header],
+    }
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
+    ap.add_argument("--report-json", default=None, help="Defaults to paths.validation_report")
     args = ap.parse_args()
 
     cfg = load_cfg(args.config)
     input_csv = cfg["paths"]["input_csv"]
     text_col = cfg["text"]["text_column"]
+    vcfg = cfg.get("validation", {}) or {}
+    report_json = args.report_json or cfg["paths"].get("validation_report", "")
 
     if not os.path.exists(input_csv):
         print(f"[ERROR] input_csv not found: {input_csv}", file=sys.stderr)
         sys.exit(1)
 
-    df = pd.read_csv(input_csv)
-    if text_col not in df.columns:
-        print(f"[ERROR] required text_column '{text_col}' not found. columns={list(df.columns)}", file=sys.stderr)
-        sys.exit(1)
+    report = validate_streaming(
+        input_csv,
+        text_col,
+        list(vcfg.get("group_columns", ["model_name", "persona_name"])),
+        int(vcfg.get("read_chunk_rows", 50000)),
+    )
+
+    print(
+        f"[OK] rows={report['rows']}, null_text={report['null_text']}, "
+        f"empty_after_cleaning={report['empty_after_cleaning']}, unique_texts={report['unique_texts']}, "
+        f"duplicate_rows={report['duplicate_rows']}"
+    )
+    lc = report["length_chars"]
+    if lc["rows"]:
+        print(f"[INFO] length_chars: p50={lc['p50']} p90={lc['p90']} p99={lc['p99']} max={lc['max']}")
+    for c, counts in report["group_counts"].items():
+        print(f"[INFO] {c}: {len(counts)} values")
+
+    if report_json:
+        os.makedirs(os.path.dirname(report_json) or ".", exist_ok=True)
+        tmp = report_json + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, report_json)
+        print(f"[OK] saved report: {report_json}")
 
-    n_total = len(df)
-    n_null = df[text_col].isna().sum()
-    print(f"[OK] rows={n_total}, null_text={n_null}")
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,30 @@
 import argparse
+import asyncio
+import base64
+import concurrent.futures
+import functools
+import gzip
+import http.client
 import json
 import os
+import queue
 import random
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
 from typing import Any
 
 import pandas as pd
 
 from axis_scoring import (
-    dictionary_confidence_from_raw,
-    dictionary_raw_signal,
-    dictionary_score_from_raw,
     json_dumps_compact,
     load_axis_config,
+    score_dictionary,
     stable_text_hash,
 )
+from axis_store import long_from_wide, write_axis_scores
+from judge_cache import JudgeCache, prompt_hash
 
 def _load_dotenv(path: str) -> None:
     if not path or not os.path.exists(path):
@@ -34,23 +42,114 @@ def _load_dotenv(path: str) -> None:
             os.environ.setdefault(k, v)
 
 
-def _load_jsonl(path: str) -> list[dict[str, Any]]:
-    if not path or not os.path.exists(path):
-        return []
-    rows: list[dict[str, Any]] = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            rows.append(json.loads(line))
-    return rows
-
-
-def _append_jsonl(path: str, obj: dict[str, Any]) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json_dumps_compact(obj) + "\n")
+_DEFAULT_OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+
+class _OpenRouterClient:
+    """Keep-alive connection pool for the judge endpoint, shared by all judge calls in a run.
+
+    Proxies follow urllib.request.urlopen: HTTP(S)_PROXY from the environment unless NO_PROXY matches the
+    host; plain HTTP is sent to the proxy with an absolute URL, HTTPS is tunnelled through it with CONNECT.
+    Errors are raised as urllib.error.HTTPError / URLError so callers keep the same retry handling.
+    """
+
+    def __init__(self, url: str | None = None, pool_size: int = 4):
+        self.url = url or os.environ.get("OPENROUTER_BASE_URL", _DEFAULT_OPENROUTER_URL)
+        parts = urllib.parse.urlsplit(self.url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported judge URL: {self.url}")
+        self._conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.hostname or ""
+        self._port = parts.port
+        self._path = parts.path or "/"
+        if parts.query:
+            self._path += "?" + parts.query
+        self._proxy: tuple[str, int | None] | None = None
+        self._proxy_headers: dict[str, str] = {}
+        proxy = None if urllib.request.proxy_bypass(self._host) else urllib.request.getproxies().get(parts.scheme)
+        if proxy:
+            pparts = urllib.parse.urlsplit(proxy if "://" in proxy else "http://" + proxy)
+            self._proxy = (pparts.hostname or "", pparts.port)
+            if pparts.username is not None:
+                cred = f"{urllib.parse.unquote(pparts.username)}:{urllib.parse.unquote(pparts.password or '')}"
+                self._proxy_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(cred.encode("utf-8")).decode("ascii")
+            if parts.scheme == "http":
+                self._path = self.url
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max(1, int(pool_size)))
+
+    def _acquire(self, timeout_s: float) -> tuple[http.client.HTTPConnection, bool]:
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = self._connect(timeout_s)
+            reused = False
+        conn.timeout = timeout_s
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout_s)
+        return conn, reused
+
+    def _connect(self, timeout_s: float) -> http.client.HTTPConnection:
+        if self._proxy is None:
+            return self._conn_cls(self._host, self._port, timeout=timeout_s)
+        conn = self._conn_cls(self._proxy[0], self._proxy[1], timeout=timeout_s)
+        if self._conn_cls is http.client.HTTPSConnection:
+            conn.set_tunnel(self._host, self._port, headers=self._proxy_headers)
+        return conn
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def post_json(self, payload: dict[str, Any], headers: dict[str, str], timeout_s: float = 120) -> Any:
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            **headers,
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+        }
+        if self._proxy is not None and self._conn_cls is http.client.HTTPConnection:
+            headers.update(self._proxy_headers)
+        for fresh_retry in (False, True):
+            conn, reused = self._acquire(timeout_s)
+            try:
+                conn.request("POST", self._path, body=body, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                # An idle keep-alive connection may have been closed by the server; retry once on a new one.
+                if reused and not fresh_retry:
+                    continue
+                raise urllib.error.URLError(e) from e
+            except TimeoutError:
+                conn.close()
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise urllib.error.URLError(e) from e
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+
+            if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+                raw = gzip.decompress(raw)
+            if resp.status < 200 or resp.status >= 300:
+                raise urllib.error.HTTPError(self.url, resp.status, resp.reason, resp.headers, None)
+            return json.loads(raw.decode("utf-8"))
+        raise urllib.error.URLError("connection closed by server")
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
 
 
 def _openrouter_request(
@@ -60,27 +159,22 @@ def _openrouter_request(
     temperature: float = 0.0,
     max_tokens: int = 1800,
     timeout_s: int = 120,
+    client: _OpenRouterClient | None = None,
 ) -> str:
-    url = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
     payload = {
         "model": model,
         "temperature": temperature,
         "max_tokens": max_tokens,
         "messages": messages,
     }
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url=url,
-        data=data,
-        method="POST",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-    )
-    with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-        raw = resp.read().decode("utf-8")
-    j = json.loads(raw)
+    own_client = client is None
+    if client is None:
+        client = _OpenRouterClient(pool_size=1)
+    try:
+        j = client.post_json(payload, headers={"Authorization": f"Bearer {api_key}"}, timeout_s=timeout_s)
+    finally:
+        if own_client:
+            client.close()
     return j["choices"][0]["message"]["content"]
 
 
@@ -141,28 +235,37 @@ def _validate_judge_result(axes_ids: list[str], obj: dict[str, Any]) -> dict[str
     return {"axes": out_axes, "notes": notes}
 
 
-def _build_prompt(axes_spec) -> tuple[str, str]:
+_JUDGE_SYSTEM = (
+    "あなたは日本語の観光案内文を10個の双極軸で採点する評価者です。"
+    "必ずJSONのみを返し、Markdownや説明文は書きません。"
+    "本文に根拠が無い場合は score=0 かつ confidenceを低めにします。"
+)
+
+_JUDGE_RULES = (
+    "【採点ルール】\n"
+    "- 各軸は score∈[-100,100]（-100=左に強い、0=中庸/不明、+100=右に強い）\n"
+    "- evidence は本文からの短い引用（原文の一部）を1〜3個。推測で作らない。\n"
+    "- confidence は 0〜1。根拠が薄い/判断不能なら低くする。\n\n"
+)
+
+
+def _axes_block(axes_spec) -> str:
     axis_lines = []
     for a in axes_spec:
         axis_lines.append(
             f'- "{a.id}": {a.name}\n'
             f"  -100=「{a.left_label}」({a.left_desc})に強い、0=中庸/不明、+100=「{a.right_label}」({a.right_desc})に強い"
         )
-    axes_block = "\n".join(axis_lines)
+    return "\n".join(axis_lines)
 
-    system = (
-        "あなたは日本語の観光案内文を10個の双極軸で採点する評価者です。"
-        "必ずJSONのみを返し、Markdownや説明文は書きません。"
-        "本文に根拠が無い場合は score=0 かつ confidenceを低めにします。"
-    )
+
+def _build_prompt(axes_spec) -> tuple[str, str]:
+    axes_block = _axes_block(axes_spec)
 
     user = (
         "次の観光案内文について、10軸で採点してください。\n\n"
-        "【採点ルール】\n"
-        "- 各軸は score∈[-100,100]（-100=左に強い、0=中庸/不明、+100=右に強い）\n"
-        "- evidence は本文からの短い引用（原文の一部）を1〜3個。推測で作らない。\n"
-        "- confidence は 0〜1。根拠が薄い/判断不能なら低くする。\n\n"
-        "【10軸】\n"
+        + _JUDGE_RULES
+        + "【10軸】\n"
         f"{axes_block}\n\n"
         "【出力JSONスキーマ（厳守）】\n"
         "{\n"
@@ -183,7 +286,270 @@ def _build_prompt(axes_spec) -> tuple[str, str]:
         "【観光案内文】\n"
         "{{TEXT}}\n"
     )
-    return system, user
+    return _JUDGE_SYSTEM, user
+
+
+def _build_batch_prompt(axes_spec) -> tuple[str, str]:
+    """Same rubric as `_build_prompt`, for several texts per request (template placeholder {{ITEMS}})."""
+    axes_block = _axes_block(axes_spec)
+    axis_schema = ",\n".join(
+        f'        "{a.id}": {{"score": 0, "confidence": 0.0, "evidence": ["..."]}}' for a in axes_spec
+    )
+
+    user = (
+        "次の複数の観光案内文（【ID:…】で区切られています）について、1件ずつ独立に10軸で採点してください。\n"
+        "他の文章の内容を採点や evidence に混ぜないでください。\n\n"
+        + _JUDGE_RULES
+        + "【10軸】\n"
+        f"{axes_block}\n\n"
+        "【出力JSONスキーマ（厳守）】\n"
+        "items には入力のすべてのIDを1回ずつ、入力と同じ順で入れます。\n"
+        "{\n"
+        '  "items": [\n'
+        "    {\n"
+        '      "id": "t1",\n'
+        '      "axes": {\n'
+        f"{axis_schema}\n"
+        "      },\n"
+        '      "notes": ""\n'
+        "    }\n"
+        "  ]\n"
+        "}\n\n"
+        "【観光案内文】\n"
+        "{{ITEMS}}\n"
+    )
+    return _JUDGE_SYSTEM, user
+
+
+def _format_batch_items(items: list[tuple[str, str]]) -> str:
+    return "\n\n".join(f"【ID:{item_id}】\n{text}" for item_id, text in items)
+
+
+def _parse_batch_result(
+    axes_ids: list[str], obj: Any, item_ids: list[str]
+) -> tuple[dict[str, dict[str, Any]], dict[str, str]]:
+    """Validate each item of a batched response on its own; returns (ok by id, error by id)."""
+    items = obj.get("items") if isinstance(obj, dict) else obj
+    if not isinstance(items, list):
+        raise ValueError("missing items array")
+    ok: dict[str, dict[str, Any]] = {}
+    errors: dict[str, str] = {}
+    for it in items:
+        item_id = str(it.get("id")) if isinstance(it, dict) else None
+        if item_id not in item_ids or item_id in ok:
+            continue
+        try:
+            ok[item_id] = _validate_judge_result(axes_ids, it)
+            errors.pop(item_id, None)
+        except ValueError as e:
+            errors[item_id] = str(e)
+    for item_id in item_ids:
+        if item_id not in ok and item_id not in errors:
+            errors[item_id] = "item missing from response"
+    return ok, errors
+
+
+class _TokenBucket:
+    """Requests-per-second limiter shared by all judge workers (rate <= 0 disables it)."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+async def _judge_one_async(
+    loop: asyncio.AbstractEventLoop,
+    executor: concurrent.futures.Executor,
+    bucket: _TokenBucket,
+    client: _OpenRouterClient,
+    api_key: str,
+    model: str,
+    axes_ids: list[str],
+    messages: list[dict[str, str]],
+) -> tuple[dict[str, Any] | None, str | None]:
+    last_err: str | None = None
+    for attempt in range(1, 4):
+        await bucket.acquire()
+        try:
+            content = await loop.run_in_executor(
+                executor,
+                functools.partial(
+                    _openrouter_request,
+                    api_key=api_key,
+                    model=model,
+                    messages=messages,
+                    temperature=0.0,
+                    max_tokens=1800,
+                    timeout_s=180,
+                    client=client,
+                ),
+            )
+            obj = _extract_json(content)
+            return _validate_judge_result(axes_ids, obj), None
+        except (urllib.error.HTTPError, urllib.error.URLError, TimeoutError) as e:
+            last_err = f"network error: {e}"
+        except Exception as e:
+            last_err = f"parse/validate error: {e}"
+
+        if attempt < 3:
+            await asyncio.sleep(min(5.0, 0.8 * attempt + random.random() * 0.5))
+    return None, last_err
+
+
+async def _judge_batch_async(
+    loop: asyncio.AbstractEventLoop,
+    executor: concurrent.futures.Executor,
+    bucket: _TokenBucket,
+    client: _OpenRouterClient,
+    api_key: str,
+    model: str,
+    axes_ids: list[str],
+    messages: list[dict[str, str]],
+    item_ids: list[str],
+) -> tuple[dict[str, dict[str, Any]] | None, dict[str, str]]:
+    """(ok by id, error by id); ok is None when the request itself kept failing (network / HTTP status)."""
+    last_err = "no response"
+    for attempt in range(1, 4):
+        await bucket.acquire()
+        try:
+            content = await loop.run_in_executor(
+                executor,
+                functools.partial(
+                    _openrouter_request,
+                    api_key=api_key,
+                    model=model,
+                    messages=messages,
+                    temperature=0.0,
+                    max_tokens=1800 * len(item_ids),
+                    timeout_s=180,
+                    client=client,
+                ),
+            )
+            return _parse_batch_result(axes_ids, _extract_json(content), item_ids)
+        except (urllib.error.HTTPError, urllib.error.URLError, TimeoutError) as e:
+            last_err = f"network error: {e}"
+        except Exception as e:
+            # An unusable batch response is split by the caller rather than re-sent as is.
+            return {}, {item_id: f"parse error: {e}" for item_id in item_ids}
+
+        if attempt < 3:
+            await asyncio.sleep(min(5.0, 0.8 * attempt + random.random() * 0.5))
+    return None, {item_id: last_err for item_id in item_ids}
+
+
+async def _judge_pending_async(
+    pending: list[dict[str, Any]],
+    api_key: str,
+    model: str,
+    axes_ids: list[str],
+    system: str,
+    user_tpl: str,
+    on_result,
+    concurrency: int = 1,
+    rps: float = 0.0,
+    sleep_s: float = 0.0,
+    batch_size: int = 1,
+    batch_prompt: tuple[str, str] | None = None,
+) -> None:
+    """Judge `pending` rows with at most `concurrency` requests in flight.
+
+    HTTP calls run in a thread pool over one keep-alive connection pool; `on_result(item, validated,
+    batched)` is called on the event loop as each row completes, so cache appends never interleave.
+
+    With batch_size > 1, up to that many texts share one request (`batch_prompt`). Items that fail
+    validation are queued again on their own: a partly failed batch re-sends only the failed items,
+    a batch with nothing usable is split in half, and a single item falls back to the one-text prompt.
+    A request that still fails on the network / HTTP level after its retries stops the run, as with
+    single texts; it is not split, since smaller requests would not help.
+    """
+    concurrency = max(1, int(concurrency))
+    batch_size = max(1, int(batch_size))
+    if batch_size > 1 and batch_prompt is None:
+        raise ValueError("batch_prompt is required when batch_size > 1")
+    loop = asyncio.get_running_loop()
+    bucket = _TokenBucket(rps)
+    client = _OpenRouterClient(pool_size=concurrency)
+    work: asyncio.Queue = asyncio.Queue()
+    for i in range(0, len(pending), batch_size):
+        work.put_nowait(pending[i : i + batch_size])
+
+    async def worker(executor: concurrent.futures.Executor) -> None:
+        # Runs until cancelled: a split batch is queued again while other workers may be idle-waiting,
+        # so completion is work.join(), not an empty queue.
+        while True:
+            group = await work.get()
+            try:
+                if len(group) == 1:
+                    item = group[0]
+                    user = user_tpl.replace("{{TEXT}}", item["text"])
+                    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+                    validated, last_err = await _judge_one_async(
+                        loop, executor, bucket, client, api_key, model, axes_ids, messages
+                    )
+                    if validated is None:
+                        raise RuntimeError(f"judge failed at row {item['row_index']}: {last_err}")
+                    on_result(item, validated, False)
+                else:
+                    item_ids = [f"t{k}" for k in range(1, len(group) + 1)]
+                    batch_system, batch_tpl = batch_prompt
+                    user = batch_tpl.replace(
+                        "{{ITEMS}}", _format_batch_items([(k, item["text"]) for k, item in zip(item_ids, group)])
+                    )
+                    messages = [{"role": "system", "content": batch_system}, {"role": "user", "content": user}]
+                    ok, errors = await _judge_batch_async(
+                        loop, executor, bucket, client, api_key, model, axes_ids, messages, item_ids
+                    )
+                    if ok is None:
+                        rows = [item["row_index"] for item in group]
+                        raise RuntimeError(f"judge failed at rows {rows}: {errors[item_ids[0]]}")
+                    failed = []
+                    for item_id, item in zip(item_ids, group):
+                        if item_id in ok:
+                            on_result(item, ok[item_id], True)
+                        else:
+                            failed.append(item)
+                    if len(failed) == len(group):
+                        mid = len(failed) // 2
+                        work.put_nowait(failed[:mid])
+                        work.put_nowait(failed[mid:])
+                    elif failed:
+                        work.put_nowait(failed)
+                if sleep_s > 0:
+                    await asyncio.sleep(sleep_s)
+            finally:
+                work.task_done()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            tasks = [asyncio.create_task(worker(executor)) for _ in range(min(concurrency, max(1, len(pending))))]
+            joined = asyncio.create_task(work.join())
+            try:
+                # Workers only finish by raising; otherwise wait until every queued group is done.
+                done, _ = await asyncio.wait([joined, *tasks], return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    t.result()
+            finally:
+                for t in (joined, *tasks):
+                    t.cancel()
+                await asyncio.gather(joined, *tasks, return_exceptions=True)
+    finally:
+        client.close()
 
 
 def main():
@@ -192,12 +558,28 @@ def main():
     ap.add_argument("--input-csv", default="data/raw/fukuroi_llm_outputs.csv")
     ap.add_argument("--text-col", default="response")
     ap.add_argument("--output-csv", default="outputs/axis_scores/axis_scores.csv")
-    ap.add_argument("--cache-jsonl", default="outputs/axis_scores/judge_cache.jsonl")
+    ap.add_argument(
+        "--output-parquet",
+        default="",
+        help="Also write long-layout Parquet (partitioned by method) to this directory, e.g. outputs/axis_scores/axis_scores_long",
+    )
+    ap.add_argument("--cache-db", default="outputs/axis_scores/judge_cache.sqlite")
+    ap.add_argument(
+        "--cache-jsonl",
+        default="outputs/axis_scores/judge_cache.jsonl",
+        help="Legacy JSONL cache, imported into --cache-db once if present",
+    )
+    ap.add_argument("--cache-commit-every", type=int, default=20)
     ap.add_argument("--dotenv", default=".env")
     ap.add_argument("--model", required=True, help="OpenRouter model name (e.g., openai/gpt-4.1-mini)")
     ap.add_argument("--max-rows", type=int, default=0)
-    ap.add_argument("--sleep", type=float, default=0.2)
+    ap.add_argument("--sleep", type=float, default=0.2, help="Pause after each judged row, per worker")
+    ap.add_argument("--concurrency", type=int, default=1, help="Max judge requests in flight")
+    ap.add_argument("--rps", type=float, default=0.0, help="Requests-per-second limit (0 = unlimited)")
+    ap.add_argument("--batch-size", type=int, default=1, help="Texts per judge request (1 = one text per request)")
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--dict-workers", type=int, default=1, help="Processes for dictionary scoring (0 = all cores)")
+    ap.add_argument("--dict-chunk-size", type=int, default=2000)
     args = ap.parse_args()
 
     random.seed(args.seed)
@@ -222,92 +604,94 @@ def main():
     text_series = df[args.text_col].astype(str)
 
     # Common dictionary baseline (for later comparison / evidence helper)
-    for axis_id in axes_ids:
-        axis_dict = dict_cfg.get(axis_id, {}) if isinstance(dict_cfg, dict) else {}
-        raws = []
-        confs = []
-        evids = []
-        for t in text_series.tolist():
-            raw, meta = dictionary_raw_signal(t, axis_dict, weights)
-            raws.append(raw)
-            confs.append(dictionary_confidence_from_raw(raw))
-            evids.append(meta.get("evidence", []))
-        df[f"dict_raw_{axis_id}"] = raws
-        df[f"dict_score_{axis_id}"] = [dictionary_score_from_raw(r) for r in raws]
-        df[f"dict_confidence_{axis_id}"] = confs
-        df[f"dict_evidence_{axis_id}"] = [json_dumps_compact(e) for e in evids]
-
-    # Load cache to resume
-    cache_rows = _load_jsonl(args.cache_jsonl)
-    cached: dict[str, dict[str, Any]] = {}
-    for r in cache_rows:
-        key = r.get("cache_key")
-        if isinstance(key, str):
-            cached[key] = r
+    dict_scores = score_dictionary(
+        text_series,
+        axes_spec,
+        dict_cfg,
+        weights,
+        n_jobs=args.dict_workers,
+        chunk_size=args.dict_chunk_size,
+    )
+    for col, values in dict_scores.columns().items():
+        df[col] = values
 
     system, user_tpl = _build_prompt(axes_spec)
-
+    p_hash = prompt_hash(system, user_tpl)
+    batch_prompt = _build_batch_prompt(axes_spec) if args.batch_size > 1 else None
+    # Results are cached under the prompt that produced them; a batched run also reuses one-text results.
+    p_hash_batch = prompt_hash(*batch_prompt) if batch_prompt is not None else None
+    lookup_hashes = [h for h in (p_hash_batch, p_hash) if h is not None]
+
+    # Cache to resume: keyed by text hash, judge model and prompt hash
+    cache = JudgeCache(args.cache_db, commit_every=args.cache_commit_every)
+    n_imported = cache.import_jsonl(args.cache_jsonl, p_hash)
+    if n_imported:
+        print(f"[INFO] imported {n_imported} cached judgements from {args.cache_jsonl}")
+
+    text_hashes = [stable_text_hash(t) for t in text_series.tolist()]
     judge_axes: dict[str, dict[str, Any]] = {}
-    for i, row in df.iterrows():
+    pending: list[dict[str, Any]] = []
+    for (i, row), text_hash in zip(df.iterrows(), text_hashes):
         text = str(row[args.text_col])
-        cache_key = f"{row.get('session_id', i)}:{stable_text_hash(text)}"
-        if cache_key in cached:
-            judge_axes[cache_key] = cached[cache_key]["result"]["axes"]
+        if text_hash in judge_axes:
+            continue
+        hit = None
+        for h in lookup_hashes:
+            hit = cache.get(text_hash, args.model, h)
+            if hit is not None:
+                break
+        if hit is not None:
+            judge_axes[text_hash] = hit["axes"]
             continue
+        judge_axes[text_hash] = {}
+        pending.append(
+            {
+                "text_hash": text_hash,
+                "row_index": int(i),
+                "session_id": row.get("session_id", None),
+                "text": text,
+            }
+        )
 
-        user = user_tpl.replace("{{TEXT}}", text)
-        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    def _on_result(item: dict[str, Any], validated: dict[str, Any], batched: bool) -> None:
+        judge_axes[item["text_hash"]] = validated["axes"]
+        cache.put(
+            item["text_hash"],
+            args.model,
+            p_hash_batch if batched else p_hash,
+            validated,
+            row_index=item["row_index"],
+            session_id=item["session_id"],
+        )
 
-        last_err: str | None = None
-        for attempt in range(1, 4):
-            try:
-                content = _openrouter_request(
+    try:
+        if pending:
+            asyncio.run(
+                _judge_pending_async(
+                    pending,
                     api_key=api_key,
                     model=args.model,
-                    messages=messages,
-                    temperature=0.0,
-                    max_tokens=1800,
-                    timeout_s=180,
-                )
-                obj = _extract_json(content)
-                validated = _validate_judge_result(axes_ids, obj)
-                judge_axes[cache_key] = validated["axes"]
-                _append_jsonl(
-                    args.cache_jsonl,
-                    {
-                        "cache_key": cache_key,
-                        "row_index": int(i),
-                        "session_id": row.get("session_id", None),
-                        "text_hash": stable_text_hash(text),
-                        "model": args.model,
-                        "result": validated,
-                    },
+                    axes_ids=axes_ids,
+                    system=system,
+                    user_tpl=user_tpl,
+                    on_result=_on_result,
+                    concurrency=args.concurrency,
+                    rps=args.rps,
+                    sleep_s=args.sleep,
+                    batch_size=args.batch_size,
+                    batch_prompt=batch_prompt,
                 )
-                last_err = None
-                break
-            except (urllib.error.HTTPError, urllib.error.URLError, TimeoutError) as e:
-                last_err = f"network error: {e}"
-            except Exception as e:
-                last_err = f"parse/validate error: {e}"
-
-            if attempt < 3:
-                time.sleep(min(5.0, 0.8 * attempt + random.random() * 0.5))
-
-        if last_err:
-            raise RuntimeError(f"judge failed at row {i}: {last_err}")
-
-        if args.sleep > 0:
-            time.sleep(args.sleep)
+            )
+    finally:
+        cache.close()
 
     # Materialize judge columns (wide format)
     for axis_id in axes_ids:
         scores = []
         confs = []
         evids = []
-        for i, row in df.iterrows():
-            text = str(row[args.text_col])
-            cache_key = f"{row.get('session_id', i)}:{stable_text_hash(text)}"
-            axes_obj = judge_axes[cache_key]
+        for text_hash in text_hashes:
+            axes_obj = judge_axes[text_hash]
             scores.append(int(axes_obj[axis_id]["score"]))
             confs.append(float(axes_obj[axis_id]["confidence"]))
             evids.append(json_dumps_compact(list(axes_obj[axis_id]["evidence"])))
@@ -319,6 +703,11 @@ def main():
     df.to_csv(args.output_csv, index=False)
     print(f"[OK] saved: {args.output_csv} rows={len(df)} axes={len(axes_ids)} model={args.model}")
 
+    if args.output_parquet:
+        table = long_from_wide(df, ["dict", "judge"], axes_ids)
+        write_axis_scores(args.output_parquet, table)
+        print(f"[OK] saved: {args.output_parquet} (method=dict,judge) records={table.num_rows}")
+
 
 if __name__ == "__main__":
     main()
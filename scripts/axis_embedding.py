@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from axis_scoring import AxisSpec, DictionaryWeights, normalize_text_for_matching, score_dictionary
+from axis_store import axis_score_methods, long_from_wide, write_axis_scores
+from embedding_store import iter_embedding_blocks
+from knn_graph import embedding_fingerprint
+
+
+# Percentiles of each axis' projection: scores map [P_LO, P_HI] to [-100, 100]; confidence is the distance
+# from P_MID relative to |P_HI - P_MID|.
+P_LO, P_MID, P_HI = 5.0, 50.0, 95.0
+
+
+def _robust_scale_to_pm100(P: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Column-wise: projections -> [-100, 100] (0 for axes whose bounds coincide)."""
+    span = hi - lo
+    flat = span == 0
+    y = 200.0 * (P - lo) / np.where(flat, 1, span) - 100.0
+    y[:, flat] = 0.0
+    return np.clip(y, -100.0, 100.0).astype(np.float32)
+
+
+def _confidence_from_projection(P: np.ndarray, mid: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    denom = np.maximum(1e-8, np.abs(hi - mid))
+    c = np.abs((P - mid) / denom)
+    return np.clip(c, 0.0, 1.0).astype(np.float32)
+
+
+def _smallest_rows(raw: np.ndarray, k: int) -> np.ndarray:
+    """(k, n_axes) row indices of each column's k smallest values, ascending; ties go to the earlier row."""
+    n, n_axes = raw.shape
+    k = min(k, n)
+    out = np.empty((k, n_axes), dtype=np.int64)
+    if k == 0:
+        return out
+    # O(n) per column instead of a full sort: the k-th smallest value, then the rows up to it
+    kth = np.partition(raw, k - 1, axis=0)[k - 1]
+    for a in range(n_axes):
+        col = raw[:, a]
+        below = np.flatnonzero(col < kth[a])
+        rows = np.concatenate([below, np.flatnonzero(col == kth[a])[: k - len(below)]])
+        out[:, a] = rows[np.lexsort((rows, col[rows]))]
+    return out
+
+
+def _select_anchors_from_dictionary(raw: np.ndarray, k: int = 6) -> tuple[np.ndarray, np.ndarray]:
+    """(left, right) anchor rows per axis, (k, n_axes) each: the k lowest / highest dictionary raw scores.
+
+    Same rows as the head / reversed tail of a stable argsort, so tied left and right anchors never overlap.
+    """
+    n = raw.shape[0]
+    return _smallest_rows(raw, k), n - 1 - _smallest_rows(-raw[::-1], k)
+
+
+@dataclass
+class AxisProjection:
+    """Embedding axes fitted on one corpus, applicable to any embeddings of the same model.
+
+    directions   (d, n_axes) unit anchor-centroid differences, oriented so the right anchors project
+                 higher (a zero column for an axis whose anchor centroids coincide)
+    orientation  (n_axes,) +1 / -1 already applied to `directions` by the anchor check (the right anchors'
+                 mean projection must exceed the left ones'; -1 only arises from rounding when the two
+                 anchor centroids nearly coincide)
+    p_lo / p_mid / p_hi   per-axis projection percentiles (P_LO / P_MID / P_HI) of the fitted corpus
+    """
+
+    axes: list[str]
+    directions: np.ndarray
+    orientation: np.ndarray
+    p_lo: np.ndarray
+    p_mid: np.ndarray
+    p_hi: np.ndarray
+
+    def project(self, X: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+        """(n, n_axes) projections, accumulated in float64 one row block at a time.
+
+        Temporaries stay at block_rows x d, and a row's projection is the same whether it is scored
+        with the whole matrix or streamed in blocks.
+        """
+        D = self.directions.astype(np.float64)
+        P = np.empty((int(X.shape[0]), D.shape[1]), dtype=np.float32)
+        for start in range(0, int(X.shape[0]), block_rows):
+            P[start:start + block_rows] = np.asarray(X[start:start + block_rows], dtype=np.float64) @ D
+        return P
+
+    def scale(self, P: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(scores in [-100, 100], confidences in [0, 1]) for projections P (n, n_axes)."""
+        return _robust_scale_to_pm100(P, self.p_lo, self.p_hi), _confidence_from_projection(P, self.p_mid, self.p_hi)
+
+    def score(self, X: np.ndarray, block_rows: int = 8192) -> tuple[np.ndarray, np.ndarray]:
+        return self.scale(self.project(X, block_rows=block_rows))
+
+
+def fit_axis_projection(
+    X: np.ndarray, raw: np.ndarray, axes_ids: list[str], anchors_k: int = 6
+) -> tuple[AxisProjection, np.ndarray, np.ndarray, np.ndarray]:
+    """(fitted axes, projections of X (n, n_axes), left anchors, right anchors) from dictionary raw scores (n, n_axes)."""
+    left, right = _select_anchors_from_dictionary(raw, k=anchors_k)
+    # (k, n_axes, d) anchor rows and (n_axes, d) centroids; only 2 * k * n_axes rows of X are touched
+    left_rows = np.asarray(X[left.ravel()], dtype=np.float32).reshape(*left.shape, -1)
+    right_rows = np.asarray(X[right.ravel()], dtype=np.float32).reshape(*right.shape, -1)
+    D = (right_rows.mean(axis=0) - left_rows.mean(axis=0)).T.astype(np.float32)
+    norms = np.linalg.norm(D, axis=0)
+    D = D / np.where(norms == 0.0, 1.0, norms)
+    # Orientation sanity: the right anchors must project higher on average, measured on each axis' own
+    # anchors with the same float64 projection used for scoring.
+    D64 = D.astype(np.float64)
+    left_mean = np.einsum("kad,da->a", left_rows.astype(np.float64), D64) / left.shape[0]
+    right_mean = np.einsum("kad,da->a", right_rows.astype(np.float64), D64) / right.shape[0]
+    flip = right_mean < left_mean
+    D[:, flip] *= -1.0
+
+    empty = np.zeros(D.shape[1], dtype=np.float32)
+    projection = AxisProjection(list(axes_ids), D, np.where(flip, -1, 1).astype(np.int8), empty, empty, empty)
+    P = projection.project(X)
+    projection.p_lo, projection.p_mid, projection.p_hi = np.percentile(P, [P_LO, P_MID, P_HI], axis=0)
+    return projection, P, left, right
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def save_axis_projection(path: str, projection: AxisProjection, X: np.ndarray, anchors_k: int) -> None:
+    """Fitted axes as npz (directions, orientation, percentile bounds) plus a "<path>.meta.json" sidecar."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(
+        tmp,
+        axes=np.asarray(projection.axes),
+        directions=projection.directions,
+        orientation=projection.orientation,
+        p_lo=projection.p_lo,
+        p_mid=projection.p_mid,
+        p_hi=projection.p_hi,
+    )
+    os.replace(tmp, path)
+    meta = {
+        "axes": list(projection.axes),
+        "dim": int(projection.directions.shape[0]),
+        "anchors_k": int(anchors_k),
+        "percentiles": {"lo": P_LO, "mid": P_MID, "hi": P_HI},
+        "fitted_rows": int(X.shape[0]),
+        "embedding_fingerprint": embedding_fingerprint(X),
+    }
+    with open(_meta_path(path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(_meta_path(path) + ".tmp", _meta_path(path))
+
+
+def load_axis_projection(path: str) -> AxisProjection:
+    if not os.path.exists(path):
+        raise SystemExit(f"axis artifact not found: {path} (run 11_axis_score_embedding.py without --apply-axes first)")
+    with np.load(path) as z:
+        return AxisProjection(
+            [str(a) for a in z["axes"]],
+            z["directions"],
+            z["orientation"],
+            z["p_lo"],
+            z["p_mid"],
+            z["p_hi"],
+        )
+
+
+def score_embedding_file(projection: AxisProjection, embeddings: str, output_csv: str, block_rows: int = 8192) -> int:
+    """Score an embedding artifact with frozen axes block by block (memory-mapped for .npy); returns rows written.
+
+    Columns: `row` (embedding row) and embed_score_* / embed_confidence_* per axis, scaled with the fitted
+    corpus' bounds, so the same rows always get the same scores.
+    """
+    cols = [c for axis_id in projection.axes for c in (f"embed_score_{axis_id}", f"embed_confidence_{axis_id}")]
+    os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
+    tmp = output_csv + ".tmp"
+    n = 0
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for start, block in iter_embedding_blocks(embeddings, block_rows=block_rows):
+            if block.shape[1] != projection.directions.shape[0]:
+                raise SystemExit(
+                    f"embedding dim {block.shape[1]} does not match the saved axes (dim {projection.directions.shape[0]})"
+                )
+            scores, confidences = projection.score(block, block_rows=block_rows)
+            out = pd.DataFrame(np.stack([scores, confidences], axis=2).reshape(len(block), -1).astype(float), columns=cols)
+            out.insert(0, "row", np.arange(start, start + len(block)))
+            out.to_csv(f, header=start == 0, index=False)
+            n += len(block)
+    os.replace(tmp, output_csv)
+    return n
+
+
+def load_axis_frame(input_csv: str, raw_input_csv: str, text_col: str) -> tuple[pd.DataFrame, np.ndarray]:
+    """Table to add `embed_*` columns to (judge output if present, else the raw input), row-aligned with 01_embed.
+
+    Also returns the kept rows' positions in that table (Parquet row_id).
+    """
+    if os.path.exists(input_csv):
+        df = pd.read_csv(input_csv).copy()
+    else:
+        df = pd.read_csv(raw_input_csv).copy()
+
+    if text_col not in df.columns:
+        raise SystemExit(f"text column not found: {text_col}")
+
+    # Align rows with the existing embeddings pipeline:
+    # scripts/01_embed.py replaces CR/LF with spaces and drops empty texts.
+    cleaned = (
+        df[text_col]
+        .astype(str)
+        .str.replace("\r", " ", regex=False)
+        .str.replace("\n", " ", regex=False)
+        .str.strip()
+    )
+    keep = cleaned.str.len() > 0
+    # Positions in the input table, so Parquet row_id matches the judge script's rows.
+    row_ids = np.flatnonzero(keep.to_numpy())
+    df = df.loc[keep].reset_index(drop=True)
+    return df, row_ids
+
+
+def score_embedding_axes(
+    df: pd.DataFrame,
+    X: np.ndarray,
+    axes_spec: list[AxisSpec],
+    dict_cfg: dict[str, Any],
+    weights: DictionaryWeights,
+    text_col: str,
+    anchors_k: int = 6,
+    dict_workers: int = 1,
+    dict_chunk_size: int = 2000,
+) -> tuple[dict[str, Any], bool, AxisProjection]:
+    """Add `embed_*` (and any missing `dict_*`) columns to `df` in place.
+
+    Returns the anchors summary, whether the dictionary baseline was computed here, and the fitted
+    AxisProjection (reusable on other embeddings: `projection.score(X_new)`).
+    """
+    axes_ids = [a.id for a in axes_spec]
+    if len(df) != X.shape[0]:
+        raise SystemExit(f"row/embedding mismatch: rows={len(df)} embeddings={X.shape[0]}")
+
+    # Ensure dictionary baseline columns exist (used as shared evidence; judge script also writes these)
+    missing_axes = [a for a in axes_spec if f"dict_raw_{a.id}" not in df.columns]
+    if missing_axes:
+        dict_scores = score_dictionary(
+            df[text_col].astype(str),
+            missing_axes,
+            dict_cfg,
+            weights,
+            n_jobs=dict_workers,
+            chunk_size=dict_chunk_size,
+        )
+        for col, values in dict_scores.columns().items():
+            df[col] = values
+
+    anchors_out: dict[str, Any] = {"meta": {"k": anchors_k}, "axes": {}}
+
+    raw = np.column_stack([df[f"dict_raw_{axis_id}"].to_numpy(dtype=np.float32) for axis_id in axes_ids])
+    projection, P, left, right = fit_axis_projection(X, raw, axes_ids, anchors_k=anchors_k)
+    scores, confidences = projection.scale(P)
+
+    def _preview(i: int) -> dict[str, Any]:
+        cols = [c for c in ["session_id", "model_display_name", "persona_name", "travel_type_name"] if c in df.columns]
+        meta = {c: df.loc[i, c] for c in cols}
+        text = normalize_text_for_matching(str(df.loc[i, text_col]))
+        return {**meta, "i": int(i), "text_preview": text[:140]}
+
+    for a, axis_id in enumerate(axes_ids):
+        df[f"embed_score_{axis_id}"] = scores[:, a].astype(float)
+        df[f"embed_confidence_{axis_id}"] = confidences[:, a].astype(float)
+
+        # Evidence: keep common dictionary-based evidence for explainability
+        if f"embed_evidence_{axis_id}" not in df.columns:
+            df[f"embed_evidence_{axis_id}"] = df[f"dict_evidence_{axis_id}"]
+
+        left_idx = [int(i) for i in left[:, a]]
+        right_idx = [int(i) for i in right[:, a]]
+        anchors_out["axes"][axis_id] = {
+            "left_indices": left_idx,
+            "right_indices": right_idx,
+            "left_preview": [_preview(i) for i in left_idx[:3]],
+            "right_preview": [_preview(i) for i in right_idx[:3]],
+        }
+
+    return anchors_out, bool(missing_axes), projection
+
+
+def save_axis_outputs(
+    df: pd.DataFrame,
+    anchors: dict[str, Any],
+    axes_ids: list[str],
+    output_csv: str,
+    anchors_json: str,
+    output_parquet: str = "",
+    row_ids: np.ndarray | None = None,
+    dict_computed: bool = False,
+    projection: AxisProjection | None = None,
+    axes_npz: str = "",
+    X: np.ndarray | None = None,
+) -> None:
+    os.makedirs(os.path.dirname(anchors_json), exist_ok=True)
+    with open(anchors_json, "w", encoding="utf-8") as f:
+        json.dump(anchors, f, ensure_ascii=False, indent=2)
+
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+    df.to_csv(output_csv, index=False)
+    print(f"[OK] saved: {output_csv} rows={len(df)} axes={len(axes_ids)}")
+    print(f"[OK] saved anchors: {anchors_json}")
+    if projection is not None and axes_npz and X is not None:
+        save_axis_projection(axes_npz, projection, X, int(anchors["meta"]["k"]))
+        print(f"[OK] saved axes: {axes_npz}")
+
+    if output_parquet:
+        # Only the embed partition is (re)written; dict is added if this run computed it or it is absent.
+        methods = ["embed"]
+        if dict_computed or "dict" not in axis_score_methods(output_parquet):
+            methods.insert(0, "dict")
+        table = long_from_wide(df, methods, axes_ids, row_ids=row_ids)
+        write_axis_scores(output_parquet, table)
+        print(f"[OK] saved: {output_parquet} (method={','.join(methods)}) records={table.num_rows}")
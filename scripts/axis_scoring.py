@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import concurrent.futures
 import dataclasses
 import hashlib
 import json
 import math
+import os
 import re
 from typing import Any, Iterable
 
+import numpy as np
 import yaml
 
 
@@ -165,6 +168,117 @@ def dictionary_raw_signal(
     return raw, meta
 
 
+class DictionaryMatcher:
+    """All-axes dictionary baseline compiled once from axis_scoring.yaml.
+
+    `match(text)` returns, per axis, the same (raw, meta) as `dictionary_raw_signal`.
+    Keywords shared between axes are tested once per text, regexes are pre-compiled,
+    and sentences are split once and only re-checked against keywords present in the text.
+    """
+
+    def __init__(self, axes_ids: Iterable[str], dict_cfg: dict[str, Any], weights: DictionaryWeights):
+        self.axes_ids = list(axes_ids)
+        self.weights = weights
+
+        # slot = 2 * axis_index + side (0=left, 1=right); multiplicity mirrors list duplicates
+        kw_slots: dict[str, dict[int, int]] = {}
+        rx_slots: dict[str, dict[int, int]] = {}
+        for ai, axis_id in enumerate(self.axes_ids):
+            axis_dict = dict_cfg.get(axis_id, {}) if isinstance(dict_cfg, dict) else {}
+            for side, side_name in enumerate(("left", "right")):
+                for kw in list(axis_dict.get(f"{side_name}_keywords", []) or []):
+                    if kw:
+                        slots = kw_slots.setdefault(kw, {})
+                        slots[2 * ai + side] = slots.get(2 * ai + side, 0) + 1
+                for pat in list(axis_dict.get(f"{side_name}_regex", []) or []):
+                    if pat:
+                        slots = rx_slots.setdefault(pat, {})
+                        slots[2 * ai + side] = slots.get(2 * ai + side, 0) + 1
+
+        self._keywords = tuple((kw, tuple(slots.items())) for kw, slots in kw_slots.items())
+        self._kw_slots = {kw: slots for kw, slots in self._keywords}
+        self._kw_axes = {kw: frozenset(slot // 2 for slot, _ in slots) for kw, slots in self._keywords}
+        self._regexes = tuple((re.compile(pat), tuple(slots.items())) for pat, slots in rx_slots.items())
+        self._rx_axes = tuple((rx, frozenset(slot // 2 for slot, _ in slots)) for rx, slots in self._regexes)
+        # split_sentences() appends "…" to truncated sentences; such keywords can hit there only
+        self._ellipsis_keywords = tuple(kw for kw, _ in self._keywords if "…" in kw)
+
+    def presence_counts(self, text: str) -> tuple[list[int], list[int], list[str]]:
+        text = normalize_text_for_matching(text)
+        n_slots = 2 * len(self.axes_ids)
+        kw_counts = [0] * n_slots
+        rx_counts = [0] * n_slots
+        present = [kw for kw, _ in self._keywords if kw in text]
+        for kw in present:
+            for slot, mult in self._kw_slots[kw]:
+                kw_counts[slot] += mult
+        for rx, slots in self._regexes:
+            if rx.search(text):
+                for slot, mult in slots:
+                    rx_counts[slot] += mult
+        return kw_counts, rx_counts, present
+
+    def evidence(self, text: str, present: list[str] | None = None, limit: int = 3) -> list[list[str]]:
+        text = normalize_text_for_matching(text)
+        if present is None:
+            present = [kw for kw, _ in self._keywords if kw in text]
+        truncated_candidates = list(present) + [kw for kw in self._ellipsis_keywords if kw not in present]
+
+        n_axes = len(self.axes_ids)
+        picked: list[list[str]] = [[] for _ in range(n_axes)]
+        open_axes = n_axes
+        for s in split_sentences(text):
+            hit_axes: set[int] = set()
+            candidates = truncated_candidates if s.endswith("…") else present
+            for kw in candidates:
+                if kw in s:
+                    hit_axes |= self._kw_axes[kw]
+            for rx, axes in self._rx_axes:
+                if rx.search(s):
+                    hit_axes |= axes
+            for ai in hit_axes:
+                if len(picked[ai]) < limit:
+                    picked[ai].append(s)
+                    if len(picked[ai]) >= limit:
+                        open_axes -= 1
+            if open_axes <= 0:
+                break
+
+        out: list[list[str]] = []
+        for sents in picked:
+            dedup: list[str] = []
+            seen = set()
+            for s in sents:
+                if s in seen:
+                    continue
+                seen.add(s)
+                dedup.append(s)
+            out.append(dedup)
+        return out
+
+    def match(self, text: str, with_evidence: bool = True) -> list[tuple[float, dict[str, Any]]]:
+        text = normalize_text_for_matching(text)
+        kw_counts, rx_counts, present = self.presence_counts(text)
+        evidence = self.evidence(text, present=present) if with_evidence else None
+
+        w = self.weights
+        out: list[tuple[float, dict[str, Any]]] = []
+        for ai in range(len(self.axes_ids)):
+            left_kw, right_kw = kw_counts[2 * ai], kw_counts[2 * ai + 1]
+            left_rx, right_rx = rx_counts[2 * ai], rx_counts[2 * ai + 1]
+            left = w.keyword_present * left_kw + w.regex_present * left_rx
+            right = w.keyword_present * right_kw + w.regex_present * right_rx
+            meta = {
+                "left_kw_present": left_kw,
+                "right_kw_present": right_kw,
+                "left_regex_present": left_rx,
+                "right_regex_present": right_rx,
+                "evidence": evidence[ai] if evidence is not None else [],
+            }
+            out.append((float(right - left), meta))
+        return out
+
+
 def dictionary_score_from_raw(raw: float, scale: float = 3.0) -> float:
     if scale <= 0:
         return float(max(-100.0, min(100.0, raw)))
@@ -177,6 +291,142 @@ def dictionary_confidence_from_raw(raw: float, max_raw: float = 6.0) -> float:
     return float(max(0.0, min(1.0, abs(raw) / max_raw)))
 
 
+@dataclasses.dataclass(frozen=True)
+class DictionaryScores:
+    axes_ids: list[str]
+    raw: np.ndarray  # (n_rows, n_axes)
+    score: np.ndarray  # (n_rows, n_axes)
+    confidence: np.ndarray  # (n_rows, n_axes)
+    evidence: list[list[list[str]]]  # column-wise: evidence[axis_index][row]
+
+    def columns(self) -> dict[str, Any]:
+        """`dict_*` columns in the order the scripts write them (raw/score/confidence/evidence per axis)."""
+        cols: dict[str, Any] = {}
+        for ai, axis_id in enumerate(self.axes_ids):
+            cols[f"dict_raw_{axis_id}"] = self.raw[:, ai]
+            cols[f"dict_score_{axis_id}"] = self.score[:, ai]
+            cols[f"dict_confidence_{axis_id}"] = self.confidence[:, ai]
+            cols[f"dict_evidence_{axis_id}"] = [json_dumps_compact(e) for e in self.evidence[ai]]
+        return cols
+
+
+def dictionary_scores_from_raw(raw: np.ndarray, scale: float = 3.0) -> np.ndarray:
+    raw = np.asarray(raw, dtype=np.float64)
+    if scale <= 0:
+        return np.clip(raw, -100.0, 100.0)
+    # raw takes only a handful of distinct values; math.tanh on those keeps the scores
+    # bit-identical to dictionary_score_from_raw (np.tanh may differ in the last ulp).
+    uniq, inv = np.unique(raw.ravel(), return_inverse=True)
+    vals = np.array([100.0 * math.tanh(r / scale) for r in uniq.tolist()], dtype=np.float64)
+    return vals[inv.ravel()].reshape(raw.shape)
+
+
+def dictionary_confidences_from_raw(raw: np.ndarray, max_raw: float = 6.0) -> np.ndarray:
+    raw = np.asarray(raw, dtype=np.float64)
+    if max_raw <= 0:
+        return np.zeros_like(raw)
+    return np.clip(np.abs(raw) / max_raw, 0.0, 1.0)
+
+
+def _match_dictionary_chunk(
+    matcher: DictionaryMatcher,
+    texts: list[str],
+    with_evidence: bool,
+) -> tuple[list[list[int]], list[list[int]], list[list[list[str]]]]:
+    n_axes = len(matcher.axes_ids)
+    kw_rows: list[list[int]] = []
+    rx_rows: list[list[int]] = []
+    evidence: list[list[list[str]]] = [[] for _ in range(n_axes)]
+    for t in texts:
+        text = normalize_text_for_matching(t)
+        kw_counts, rx_counts, present = matcher.presence_counts(text)
+        kw_rows.append(kw_counts)
+        rx_rows.append(rx_counts)
+        if with_evidence:
+            for ai, ev in enumerate(matcher.evidence(text, present=present)):
+                evidence[ai].append(ev)
+        else:
+            for ai in range(n_axes):
+                evidence[ai].append([])
+    return kw_rows, rx_rows, evidence
+
+
+# Set once per worker process by the pool initializer, so the matcher is not pickled per task.
+_WORKER_MATCHER: DictionaryMatcher | None = None
+
+
+def _init_dictionary_worker(matcher: DictionaryMatcher) -> None:
+    global _WORKER_MATCHER
+    _WORKER_MATCHER = matcher
+
+
+def _match_dictionary_chunk_in_worker(
+    task: tuple[list[str], bool],
+) -> tuple[list[list[int]], list[list[int]], list[list[list[str]]]]:
+    texts, with_evidence = task
+    assert _WORKER_MATCHER is not None
+    return _match_dictionary_chunk(_WORKER_MATCHER, texts, with_evidence)
+
+
+def score_dictionary(
+    texts: Iterable[str],
+    axes_spec: list[AxisSpec],
+    dict_cfg: dict[str, Any],
+    weights: DictionaryWeights,
+    matcher: DictionaryMatcher | None = None,
+    with_evidence: bool = True,
+    n_jobs: int = 1,
+    chunk_size: int = 2000,
+) -> DictionaryScores:
+    """Dictionary baseline for all rows x axes.
+
+    n_jobs > 1 scores chunks of `chunk_size` texts in a process pool (n_jobs <= 0 uses all cores).
+    Results are reassembled in input order and are identical to the serial path.
+    """
+    axes_ids = [a.id for a in axes_spec]
+    if matcher is None or matcher.axes_ids != axes_ids:
+        matcher = DictionaryMatcher(axes_ids, dict_cfg, weights)
+
+    texts = list(texts)
+    n_axes = len(axes_ids)
+    if n_jobs <= 0:
+        n_jobs = os.cpu_count() or 1
+    chunk_size = max(1, int(chunk_size))
+    n_jobs = min(n_jobs, (len(texts) + chunk_size - 1) // chunk_size)
+
+    if n_jobs <= 1:
+        kw_rows, rx_rows, evidence = _match_dictionary_chunk(matcher, texts, with_evidence)
+    else:
+        kw_rows, rx_rows = [], []
+        evidence = [[] for _ in range(n_axes)]
+        tasks = [(texts[i : i + chunk_size], with_evidence) for i in range(0, len(texts), chunk_size)]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_dictionary_worker,
+            initargs=(matcher,),
+        ) as ex:
+            # map() yields in submission order, so row order is deterministic
+            for kw_part, rx_part, ev_part in ex.map(_match_dictionary_chunk_in_worker, tasks):
+                kw_rows.extend(kw_part)
+                rx_rows.extend(rx_part)
+                for ai in range(n_axes):
+                    evidence[ai].extend(ev_part[ai])
+
+    kw = np.asarray(kw_rows, dtype=np.float64).reshape(-1, 2 * n_axes)
+    rx = np.asarray(rx_rows, dtype=np.float64).reshape(-1, 2 * n_axes)
+    left = weights.keyword_present * kw[:, 0::2] + weights.regex_present * rx[:, 0::2]
+    right = weights.keyword_present * kw[:, 1::2] + weights.regex_present * rx[:, 1::2]
+    raw = right - left
+
+    return DictionaryScores(
+        axes_ids=axes_ids,
+        raw=raw,
+        score=dictionary_scores_from_raw(raw),
+        confidence=dictionary_confidences_from_raw(raw),
+        evidence=evidence,
+    )
+
+
 def json_dumps_compact(obj: Any) -> str:
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+# Long-layout axis scores: one record per (row_id, axis, method) with
+#   row_id: int64, axis: string, score: float64, confidence: float64, evidence: list<string>
+# stored as a Parquet dataset partitioned by method (hive style: <dir>/method=judge/part-*.parquet).
+# Writing a method replaces only that method's partition, so adding `embed` never rewrites
+# `dict` or `judge`. Files are sorted by (axis, row_id), so axis filters skip row groups.
+AXIS_METHODS = ("dict", "judge", "embed")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise SystemExit("pyarrow is required for Parquet axis scores (pip install pyarrow)") from e
+    return pa, ds
+
+
+def _schema(pa):
+    return pa.schema(
+        [
+            ("row_id", pa.int64()),
+            ("axis", pa.string()),
+            ("method", pa.string()),
+            ("score", pa.float64()),
+            ("confidence", pa.float64()),
+            ("evidence", pa.list_(pa.string())),
+        ]
+    )
+
+
+def _evidence_list(v: Any) -> list[str]:
+    if isinstance(v, str):
+        v = json.loads(v) if v else []
+    if v is None or (isinstance(v, float) and np.isnan(v)):
+        return []
+    return [str(s) for s in v]
+
+
+def long_from_wide(
+    df: pd.DataFrame,
+    methods: Iterable[str],
+    axes_ids: list[str],
+    row_ids: Iterable[int] | None = None,
+):
+    """Arrow table in the long layout from the wide `<method>_{score,confidence,evidence}_<axis>` columns."""
+    pa, _ = _require_pyarrow()
+    ids = np.arange(len(df), dtype=np.int64) if row_ids is None else np.asarray(list(row_ids), dtype=np.int64)
+    parts = []
+    for method in methods:
+        if method not in AXIS_METHODS:
+            raise ValueError(f"unknown axis score method: {method}")
+        parts.extend(_long_parts(df, method, axes_ids, ids))
+    schema = _schema(pa)
+    tables = [pa.Table.from_pydict(p, schema=schema) for p in parts]
+    return pa.concat_tables(tables) if tables else schema.empty_table()
+
+
+def _long_parts(df: pd.DataFrame, method: str, axes_ids: list[str], ids: np.ndarray) -> list[dict[str, Any]]:
+    n = len(ids)
+    parts = []
+    for axis_id in axes_ids:
+        parts.append(
+            {
+                "row_id": ids,
+                "axis": [axis_id] * n,
+                "method": [method] * n,
+                "score": df[f"{method}_score_{axis_id}"].to_numpy(dtype=np.float64),
+                "confidence": df[f"{method}_confidence_{axis_id}"].to_numpy(dtype=np.float64),
+                "evidence": [_evidence_list(v) for v in df[f"{method}_evidence_{axis_id}"].tolist()],
+            }
+        )
+    return parts
+
+
+def write_axis_scores(path: str, table) -> None:
+    """Write (or replace) the method partitions present in `table`; other methods are left untouched."""
+    pa, ds = _require_pyarrow()
+    os.makedirs(path, exist_ok=True)
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("method", pa.string())]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+    )
+
+
+def axis_score_methods(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        d.split("=", 1)[1]
+        for d in os.listdir(path)
+        if d.startswith("method=") and os.path.isdir(os.path.join(path, d))
+    )
+
+
+def read_axis_scores(
+    path: str,
+    methods: Iterable[str] | None = None,
+    axes: Iterable[str] | None = None,
+    columns: Iterable[str] | None = None,
+) -> pd.DataFrame:
+    """Load only the requested methods / axes / columns of a long-layout dataset."""
+    _, ds = _require_pyarrow()
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    flt = None
+    if methods is not None:
+        flt = ds.field("method").isin(list(methods))
+    if axes is not None:
+        cond = ds.field("axis").isin(list(axes))
+        flt = cond if flt is None else flt & cond
+    return dataset.to_table(columns=list(columns) if columns is not None else None, filter=flt).to_pandas()
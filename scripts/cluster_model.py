@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+
+import numpy as np
+
+from knn_graph import embedding_fingerprint
+
+# cluster.mode: incremental (or 03_cluster.py --assign-only) keeps the fitted clusterer at
+# cluster.model_path (joblib bundle) with a "<path>.meta.json" state:
+#   bundle: reducer    fitted cluster.reduce projection (PCA / UMAP able to transform) or None
+#           model      hdbscan.HDBSCAN fitted with prediction_data, or {"centroids": ...} for kmeans
+#           reference  fixed-seed sample of the fitted embedding rows (for the drift check)
+#   state:  params               cluster settings the model was fitted with (a change forces a recluster)
+#           n_fit / n_rows       rows fitted / rows currently in cluster_csv
+#           prefix_fingerprint   embedding_fingerprint(X[:n_rows]); new rows are only ever appended
+#           ref_knn_dist         median distance of reference rows to their DRIFT_NEIGHBORS-th neighbour
+# New rows get labels from the saved model (hdbscan.approximate_predict / nearest centroid), so existing
+# cluster ids never change, and are appended to cluster_csv with a `cluster_strength` column (hdbscan
+# membership probability; kmeans 1 - d1/d2, the margin between the nearest and second-nearest centroid).
+# A full recluster happens on request or when the new rows sit further from the fitted rows than
+# `recluster_drift` x ref_knn_dist. Drift is measured on the embeddings, not in cluster space: UMAP's
+# transform() places new rows less tightly than the fitted ones, which would read as drift.
+DRIFT_NEIGHBORS = 10
+REFERENCE_ROWS = 5000
+
+
+def cluster_params(ccfg: dict) -> dict[str, Any]:
+    method = ccfg["method"]
+    return {"method": method, "reduce": ccfg.get("reduce") or {}, method: ccfg.get(method) or {}}
+
+
+def cluster_model_path(cfg: dict) -> str:
+    return str(cfg["cluster"].get("model_path") or os.path.join(os.path.dirname(cfg["paths"]["cluster_csv"]), "cluster_model.joblib"))
+
+
+def _state_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def load_cluster_state(path: str) -> dict[str, Any] | None:
+    if not os.path.exists(path) or not os.path.exists(_state_path(path)):
+        return None
+    with open(_state_path(path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_cluster_state(path: str, state: dict[str, Any]) -> None:
+    tmp = _state_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _state_path(path))
+
+
+def save_cluster_model(path: str, bundle: dict[str, Any]) -> None:
+    import joblib
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    joblib.dump(bundle, tmp)
+    os.replace(tmp, path)
+
+
+def load_cluster_model(path: str) -> dict[str, Any]:
+    import joblib
+
+    return joblib.load(path)
+
+
+def kmeans_strength(Xc: np.ndarray, centroids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(nearest centroid, 1 - d1/d2) per row."""
+    from sklearn.metrics import pairwise_distances
+
+    D = pairwise_distances(np.asarray(Xc, dtype=np.float32), np.asarray(centroids, dtype=np.float32))
+    if D.shape[1] < 2:
+        return np.zeros(len(D), dtype=np.int64), np.ones(len(D))
+    two = np.partition(D, 1, axis=1)[:, :2]
+    strength = 1.0 - two[:, 0] / np.maximum(two[:, 1], 1e-12)
+    return np.argmin(D, axis=1), strength
+
+
+def fit_clusterer(Xc: np.ndarray, ccfg: dict, knn=None) -> tuple[np.ndarray, np.ndarray, dict[str, Any], list[dict[str, Any]], Any]:
+    """(labels, strengths, info, report rows, model) for a full fit whose model can label new rows."""
+    method = ccfg["method"]
+    if method == "hdbscan":
+        import hdbscan
+
+        from hdbscan_sweep import hdbscan_params, sweep_hdbscan
+
+        hcfg = dict(ccfg["hdbscan"])
+        info: dict[str, Any] = {}
+        report: list[dict[str, Any]] = []
+        if hcfg.get("sweep"):
+            # the sweep only picks min_cluster_size; the kept model is refitted with it and prediction data
+            _, info, report = sweep_hdbscan(Xc, hcfg, knn=knn)
+            hcfg["min_cluster_size"] = info["min_cluster_size"]
+        model = hdbscan.HDBSCAN(**hdbscan_params(hcfg), prediction_data=True).fit(Xc)
+        labels = np.asarray(model.labels_)
+        info["n_clusters"] = int(labels.max()) + 1 if len(labels) else 0
+        info["n_noise"] = int((labels == -1).sum())
+        return labels, np.asarray(model.probabilities_, dtype=np.float64), info, report, model
+    if method == "kmeans":
+        from kmeans_select import select_kmeans
+
+        labels, info, report = select_kmeans(Xc, ccfg["kmeans"])
+        Xf = np.asarray(Xc, dtype=np.float64)
+        k = int(labels.max()) + 1
+        centroids = np.zeros((k, Xf.shape[1]))
+        np.add.at(centroids, labels, Xf)
+        centroids /= np.maximum(np.bincount(labels, minlength=k), 1)[:, None]
+        _, strengths = kmeans_strength(Xc, centroids)
+        return labels, strengths, info, report, {"centroids": centroids}
+    raise ValueError(f"unknown cluster.method: {method}")
+
+
+def assign_clusters(bundle: dict[str, Any], Xc_new: np.ndarray, method: str) -> tuple[np.ndarray, np.ndarray]:
+    """(labels, strengths) of new rows (already in cluster space) under the saved model."""
+    if method == "hdbscan":
+        import hdbscan
+
+        labels, strengths = hdbscan.approximate_predict(bundle["model"], Xc_new)
+        return np.asarray(labels), np.asarray(strengths, dtype=np.float64)
+    return kmeans_strength(Xc_new, bundle["model"]["centroids"])
+
+
+def reference_rows(X: np.ndarray, seed: int = 0) -> np.ndarray:
+    n = int(X.shape[0])
+    take = np.sort(np.random.default_rng(seed).choice(n, size=min(n, REFERENCE_ROWS), replace=False))
+    return np.asarray(X[take], dtype=np.float32)
+
+
+def _kth_distance(ref: np.ndarray, Xq: np.ndarray, k: int) -> np.ndarray:
+    from sklearn.neighbors import NearestNeighbors
+
+    k = min(k, len(ref))
+    d, _ = NearestNeighbors(n_neighbors=k).fit(ref).kneighbors(np.asarray(Xq, dtype=np.float32))
+    return d[:, k - 1]
+
+
+def reference_knn_distance(ref: np.ndarray) -> float:
+    # k + 1: each reference row finds itself first
+    return float(np.median(_kth_distance(ref, ref, DRIFT_NEIGHBORS + 1)))
+
+
+def new_rows_drift(ref: np.ndarray, X_new: np.ndarray, ref_dist: float) -> float:
+    if not len(X_new) or ref_dist <= 0:
+        return float("inf")
+    return float(np.median(_kth_distance(ref, X_new, DRIFT_NEIGHBORS)) / ref_dist)
+
+
+def recluster_reason(state: dict[str, Any] | None, ccfg: dict, X: np.ndarray, csv_rows: int | None) -> str | None:
+    """Why the saved model cannot just label the new rows (None: it can)."""
+    if state is None:
+        return "no saved model"
+    if state.get("params") != json.loads(json.dumps(cluster_params(ccfg))):
+        return "cluster settings changed"
+    n_rows = int(state["n_rows"])
+    if csv_rows != n_rows:
+        return "cluster_csv does not match the saved model"
+    if n_rows > int(X.shape[0]) or embedding_fingerprint(X[:n_rows]) != state.get("prefix_fingerprint"):
+        return "existing embedding rows changed"
+    return None
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+
+import numpy as np
+
+from knn_graph import embedding_fingerprint
+
+# Pre-reduction for clustering (cluster.reduce): the clusterer runs on a low-dimensional copy of the
+# embeddings, where HDBSCAN's kd-tree / boruvka neighbour search works, instead of on the full vectors.
+#   method: none | pca | umap   (umap: an intermediate UMAP, typically 5-20 components with min_dist 0)
+# The reduced matrix is saved to cluster.reduce.path (npz) with a "<path>.meta.json" sidecar (settings +
+# embedding fingerprint) and reused while both still match, so re-clustering with other hdbscan / kmeans
+# settings skips the reduction.
+REDUCE_METHODS = ("none", "pca", "umap")
+REDUCE_PARAMS = ("method", "n_components", "n_neighbors", "min_dist", "metric", "random_state")
+
+
+def reduce_params(rcfg: dict) -> dict[str, Any]:
+    return {k: rcfg.get(k) for k in REDUCE_PARAMS}
+
+
+def reduce_enabled(cfg: dict) -> bool:
+    method = str((cfg["cluster"].get("reduce") or {}).get("method", "none"))
+    if method not in REDUCE_METHODS:
+        raise ValueError(f"unknown cluster.reduce.method: {method} (expected one of {', '.join(REDUCE_METHODS)})")
+    return method != "none"
+
+
+def cluster_space_path(cfg: dict) -> str:
+    rcfg = cfg["cluster"].get("reduce") or {}
+    return str(rcfg.get("path") or os.path.join(os.path.dirname(cfg["paths"]["cluster_csv"]), "cluster_space.npz"))
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def _umap_cfg(rcfg: dict) -> dict[str, Any]:
+    return {
+        "n_components": int(rcfg.get("n_components", 10)),
+        "n_neighbors": int(rcfg.get("n_neighbors", 30)),
+        "min_dist": float(rcfg.get("min_dist", 0.0)),
+        "metric": str(rcfg.get("metric", "cosine")),
+        "random_state": int(rcfg.get("random_state", 42)),
+    }
+
+
+def make_reducer(X: np.ndarray, rcfg: dict, knn=None):
+    """Unfitted PCA / UMAP for cluster.reduce. Only a reducer built without `knn` can transform() new rows later."""
+    method = str(rcfg.get("method", "none"))
+    if method == "pca":
+        from sklearn.decomposition import PCA
+
+        return PCA(n_components=int(rcfg.get("n_components", 10)), random_state=int(rcfg.get("random_state", 42)))
+    if method == "umap":
+        from pipeline_session import umap_reducer
+
+        return umap_reducer(X, _umap_cfg(rcfg), knn=knn)
+    raise ValueError(f"unknown cluster.reduce.method: {method} (expected one of {', '.join(REDUCE_METHODS)})")
+
+
+def reduce_embeddings(X: np.ndarray, rcfg: dict, knn=None) -> np.ndarray:
+    if str(rcfg.get("method", "none")) == "umap":
+        from pipeline_session import fit_umap
+
+        return np.asarray(fit_umap(X, _umap_cfg(rcfg), knn=knn), dtype=np.float32)
+    return np.asarray(make_reducer(X, rcfg).fit_transform(np.asarray(X, dtype=np.float32)), dtype=np.float32)
+
+
+def save_cluster_space(path: str, Z: np.ndarray, X: np.ndarray, rcfg: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, reduced=Z)
+    os.replace(tmp, path)
+    meta = {
+        "params": reduce_params(rcfg),
+        "shape": [int(s) for s in X.shape],
+        "embedding_fingerprint": embedding_fingerprint(X),
+    }
+    with open(_meta_path(path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(_meta_path(path) + ".tmp", _meta_path(path))
+
+
+def load_cluster_space(path: str, X: np.ndarray, rcfg: dict) -> np.ndarray | None:
+    """The saved reduction, or None when it is missing, made with other settings or from other embeddings."""
+    if not os.path.exists(path) or not os.path.exists(_meta_path(path)):
+        return None
+    with open(_meta_path(path), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("params") != reduce_params(rcfg):
+        return None
+    if list(meta.get("shape", [])) != [int(s) for s in X.shape] or meta.get("embedding_fingerprint") != embedding_fingerprint(X):
+        return None
+    with np.load(path) as z:
+        return z["reduced"]
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import concurrent.futures
+import multiprocessing
+import os
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+# embedding.backend:
+# - "sentence_transformers": one model in this process (CPU or CUDA); the original behaviour.
+# - "sentence_transformers_pool": N CPU worker processes, each with its own model copy and
+#   `threads_per_worker` torch threads. Batches go through the pool's shared task queue and come
+#   back in submission order.
+# - "sentence_transformers_int8": CPU, offline, from `local_model_dir`, with the nn.Linear layers
+#   dynamically quantized to int8 (weights int8, activations quantized per batch at run time);
+#   `int8_threads` torch threads in this one process (0 = torch's default, i.e. all cores).
+EMBEDDING_BACKENDS = ("sentence_transformers", "sentence_transformers_pool", "sentence_transformers_int8")
+
+
+def pick_device(device_cfg: str) -> str:
+    if device_cfg in ("cpu", "cuda"):
+        return device_cfg
+    # auto
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+class LazyEncoder:
+    """SentenceTransformer loaded on first use (nothing is loaded when everything is cached).
+
+    device "auto" is resolved at that point too, since asking torch for CUDA already costs its start-up;
+    until then `device` reports the configured value.
+    """
+
+    def __init__(self, model_name: str, device: str, normalize: bool, prefix: str):
+        self.model_name = model_name
+        self.device = device
+        self.normalize = normalize
+        self.prefix = prefix
+        self.workers = 1
+        # Anything that changes the vectors beyond (model_name, prefix, normalize); part of the cache key.
+        self.variant = ""
+        self.model = None
+
+    def _load(self):
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.device = pick_device(self.device)
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+        return self.model
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        model = self._load()
+        # one forward pass per call: the caller already decided the batch
+        vec = model.encode(
+            [self.prefix + t for t in texts],
+            batch_size=max(1, len(texts)),
+            normalize_embeddings=self.normalize,
+            show_progress_bar=False,
+        )
+        return np.asarray(vec, dtype=np.float32)
+
+    def encode_batches(self, batches: Iterable[list[str]]) -> Iterator[np.ndarray]:
+        for texts in batches:
+            yield self.encode(texts)
+
+    def token_lengths(self, texts: list[str]) -> list[int]:
+        model = self._load()
+        enc = model.tokenizer(
+            [self.prefix + t for t in texts],
+            add_special_tokens=True,
+            truncation=True,
+            max_length=model.max_seq_length,
+        )
+        return [len(ids) for ids in enc["input_ids"]]
+
+    def describe(self) -> dict[str, Any]:
+        return {"backend": "sentence_transformers", "device": self.device}
+
+    def close(self) -> None:
+        pass
+
+
+_WORKER_ENCODER: LazyEncoder | None = None
+
+
+def _init_encoder_worker(model_name: str, normalize: bool, prefix: str, threads: int) -> None:
+    global _WORKER_ENCODER
+    # Must be set before torch is imported in this process, or the BLAS pools are already sized.
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    import torch
+    torch.set_num_threads(threads)
+    _WORKER_ENCODER = LazyEncoder(model_name, "cpu", normalize, prefix)
+    _WORKER_ENCODER._load()
+
+
+def _encode_in_worker(texts: list[str]) -> np.ndarray:
+    return _WORKER_ENCODER.encode(texts)
+
+
+def _token_lengths_in_worker(texts: list[str]) -> list[int]:
+    return _WORKER_ENCODER.token_lengths(texts)
+
+
+class EncoderPool(LazyEncoder):
+    """CPU encoder spread over worker processes (started on first use, like LazyEncoder's model).
+
+    Workers are spawned rather than forked so each one initialises torch with its own thread count.
+    """
+
+    def __init__(self, model_name: str, normalize: bool, prefix: str, workers: int = 0, threads_per_worker: int = 1):
+        super().__init__(model_name, "cpu", normalize, prefix)
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        workers = int(workers)
+        if workers <= 0:
+            workers = max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.workers = workers
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+
+    def _pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_encoder_worker,
+                initargs=(self.model_name, self.normalize, self.prefix, self.threads_per_worker),
+            )
+        return self._executor
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        return self._pool().submit(_encode_in_worker, texts).result()
+
+    def encode_batches(self, batches: Iterable[list[str]]) -> Iterator[np.ndarray]:
+        # Executor.map submits everything up front and yields results in input order.
+        return self._pool().map(_encode_in_worker, batches)
+
+    def token_lengths(self, texts: list[str]) -> list[int]:
+        step = max(1, -(-len(texts) // self.workers))
+        parts = [texts[i:i + step] for i in range(0, len(texts), step)]
+        return [n for part in self._pool().map(_token_lengths_in_worker, parts) for n in part]
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "backend": "sentence_transformers_pool",
+            "device": "cpu",
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class QuantizedEncoder(LazyEncoder):
+    """int8 dynamic quantization of the Linear layers, loaded from a local directory without network."""
+
+    def __init__(self, model_name: str, model_dir: str, normalize: bool, prefix: str, threads: int = 0):
+        super().__init__(model_name, "cpu", normalize, prefix)
+        self.model_dir = model_dir
+        self.threads = int(threads)
+        self.variant = "int8-dynamic-linear"
+        self.engine = None
+
+    def _load_float(self):
+        if not self.model_dir or not os.path.isdir(self.model_dir):
+            raise SystemExit(
+                f"embedding.local_model_dir not found: {self.model_dir!r} "
+                "(save the model first, e.g. SentenceTransformer(name).save(dir))"
+            )
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_dir, device="cpu")
+
+    def _load(self):
+        if self.model is None:
+            import torch
+            if self.threads > 0:
+                torch.set_num_threads(self.threads)
+            self.engine = torch.backends.quantized.engine
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self._load_float(), {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return self.model
+
+    def agreement(self, texts: list[str], X: np.ndarray, batch_size: int = 32) -> dict[str, Any]:
+        """Cosine similarity between the stored (quantized) rows X and a float32 re-encode of `texts`."""
+        ref_model = self._load_float()
+        ref = np.asarray(
+            ref_model.encode(
+                [self.prefix + t for t in texts],
+                batch_size=batch_size,
+                normalize_embeddings=self.normalize,
+                show_progress_bar=False,
+            ),
+            dtype=np.float32,
+        )
+        X = np.asarray(X, dtype=np.float32)
+        denom = np.linalg.norm(X, axis=1) * np.linalg.norm(ref, axis=1)
+        cos = np.sum(X * ref, axis=1) / np.where(denom > 0, denom, 1.0)
+        return {
+            "rows": int(len(texts)),
+            "cosine_mean": float(cos.mean()) if len(cos) else None,
+            "cosine_min": float(cos.min()) if len(cos) else None,
+            "cosine_p05": float(np.percentile(cos, 5)) if len(cos) else None,
+        }
+
+    def describe(self) -> dict[str, Any]:
+        if self.engine is None:
+            import torch
+            self.engine = torch.backends.quantized.engine
+        return {
+            "backend": "sentence_transformers_int8",
+            "device": "cpu",
+            "local_model_dir": self.model_dir,
+            "quantization": {
+                "method": "dynamic",
+                "dtype": "qint8",
+                "modules": ["torch.nn.Linear"],
+                "engine": self.engine,
+                "threads": self.threads,
+            },
+        }
+
+
+def make_encoder(emb_cfg: dict, device: str) -> LazyEncoder:
+    backend = str(emb_cfg.get("backend", "sentence_transformers"))
+    model_name = emb_cfg["model_name"]
+    normalize = bool(emb_cfg.get("normalize", True))
+    prefix = emb_cfg.get("e5_prefix", "")
+    if backend == "sentence_transformers":
+        return LazyEncoder(model_name, device, normalize, prefix)
+    if backend == "sentence_transformers_pool":
+        return EncoderPool(
+            model_name,
+            normalize,
+            prefix,
+            workers=int(emb_cfg.get("workers", 0)),
+            threads_per_worker=int(emb_cfg.get("threads_per_worker", 1)),
+        )
+    if backend == "sentence_transformers_int8":
+        return QuantizedEncoder(
+            model_name,
+            str(emb_cfg.get("local_model_dir") or ""),
+            normalize,
+            prefix,
+            threads=int(emb_cfg.get("int8_threads", 0)),
+        )
+    raise ValueError(f"unknown embedding.backend: {backend} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
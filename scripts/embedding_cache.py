@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import sqlite3
+import time
+from typing import Iterator
+
+import numpy as np
+
+from axis_scoring import json_dumps_compact, stable_text_hash
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store in SQLite (WAL).
+
+    Vectors are keyed by (model_name, e5_prefix, normalize, stable_text_hash(cleaned text)); the
+    first three are folded into a namespace hash so changing any of them never reuses old vectors.
+    A non-empty `variant` (e.g. a quantized backend) gets a namespace of its own as well.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        model_name: str,
+        e5_prefix: str,
+        normalize: bool,
+        timeout_s: float = 60.0,
+        variant: str = "",
+    ):
+        self.path = path
+        key = {"model_name": model_name, "e5_prefix": e5_prefix, "normalize": bool(normalize)}
+        if variant:
+            key["variant"] = variant
+        self.namespace = stable_text_hash(json_dumps_compact(key))
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout_s, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={int(timeout_s * 1000)}")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                namespace TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vec BLOB NOT NULL,
+                PRIMARY KEY (namespace, text_hash)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS namespaces (
+                namespace TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                e5_prefix TEXT NOT NULL,
+                normalize INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        with self._transaction():
+            self._conn.execute(
+                "INSERT OR IGNORE INTO namespaces (namespace, model_name, e5_prefix, normalize, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, model_name, e5_prefix, int(bool(normalize)), time.time()),
+            )
+
+    def get_many(self, text_hashes: list[str], chunk: int = 500) -> dict[str, np.ndarray]:
+        out: dict[str, np.ndarray] = {}
+        for i in range(0, len(text_hashes), chunk):
+            part = text_hashes[i : i + chunk]
+            placeholders = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT text_hash, dim, vec FROM embeddings WHERE namespace = ? AND text_hash IN ({placeholders})",
+                (self.namespace, *part),
+            )
+            for text_hash, dim, vec in rows:
+                v = np.frombuffer(vec, dtype=np.float32)
+                if v.shape[0] == dim:
+                    out[text_hash] = v
+        return out
+
+    def put_many(self, text_hashes: list[str], X: np.ndarray) -> None:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        rows = [(self.namespace, h, int(X.shape[1]), X[i].tobytes()) for i, h in enumerate(text_hashes)]
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (namespace, text_hash, dim, vec) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "EmbeddingCache":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
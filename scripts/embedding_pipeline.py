@@ -0,0 +1,285 @@
+import json, os, time
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from axis_scoring import json_dumps_compact, stable_text_hash
+from embedding_backends import LazyEncoder, QuantizedEncoder, make_encoder
+from embedding_cache import EmbeddingCache
+from embedding_store import NpyEmbeddingWriter, embedding_path, load_embeddings, save_embeddings, write_meta
+
+def ensure_dir(p: str):
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+
+def clean_texts(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.replace("\r", " ").str.replace("\n", " ").str.strip()
+
+def plan_token_batches(lengths: list[int], max_tokens: int) -> list[list[int]]:
+    # Longest first, then greedily fill each batch while rows * longest_row (= padded tokens) fits the budget.
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches: list[list[int]] = []
+    cur: list[int] = []
+    cur_max = 0
+    for i in order:
+        n = max(1, lengths[i])
+        if cur and (len(cur) + 1) * max(cur_max, n) > max_tokens:
+            batches.append(cur)
+            cur, cur_max = [], 0
+        cur.append(i)
+        cur_max = max(cur_max, n)
+    if cur:
+        batches.append(cur)
+    return batches
+
+def embed_with_cache(
+    texts: list[str],
+    encoder: LazyEncoder,
+    cache: EmbeddingCache | None,
+    batch_size: int,
+    progress: bool = False,
+    batching: str = "fixed",
+    max_tokens_per_batch: int = 8192,
+) -> tuple[np.ndarray, dict]:
+    # Content-addressed reuse: only texts not seen before (for this model/prefix/normalize) are encoded,
+    # and duplicate texts are encoded once.
+    hashes = [stable_text_hash(t) for t in texts]
+    text_by_hash = dict(zip(hashes, texts))
+    unique_hashes = list(text_by_hash.keys())
+
+    vectors = cache.get_many(unique_hashes) if cache is not None else {}
+    misses = [h for h in unique_hashes if h not in vectors]
+    stats = {"rows": len(texts), "unique": len(unique_hashes), "cached": len(vectors), "encoded": len(misses)}
+
+    if batching not in ("fixed", "length_bucketed"):
+        raise ValueError(f"unknown embedding.batching: {batching}")
+    if not misses:
+        # fully cached (e.g. a rerun on the same CSV): nothing to encode, no tokenizer call
+        batches = []
+    elif batching == "length_bucketed":
+        # Batches of similar token length under a padded-token budget; vectors are keyed by hash,
+        # so the original row order is restored below.
+        lengths = encoder.token_lengths([text_by_hash[h] for h in misses])
+        batches = [[misses[j] for j in idx] for idx in plan_token_batches(lengths, max_tokens_per_batch)]
+    else:
+        batches = [misses[i:i+batch_size] for i in range(0, len(misses), batch_size)]
+
+    t0 = time.perf_counter()
+    results = encoder.encode_batches([text_by_hash[h] for h in b] for b in batches)
+    pairs = zip(batches, results)
+    for batch_hashes, vec in (tqdm(pairs, total=len(batches), desc="embedding") if progress else pairs):
+        vectors.update(zip(batch_hashes, vec))
+        if cache is not None:
+            cache.put_many(batch_hashes, vec)
+    stats["encode_seconds"] = time.perf_counter() - t0
+
+    if not hashes:
+        return np.zeros((0, 0), dtype=np.float32), stats
+    return np.vstack([vectors[h] for h in hashes]).astype(np.float32), stats
+
+def embedding_meta(encoder: LazyEncoder, quant_check: dict | None = None) -> dict:
+    meta = {"model_name": encoder.model_name, "e5_prefix": encoder.prefix, "normalize": encoder.normalize, **encoder.describe()}
+    if quant_check is not None:
+        meta["quantization_check"] = quant_check
+    return meta
+
+def quantization_check(encoder: LazyEncoder, texts: list[str], X, n_rows: int, seed: int) -> dict | None:
+    # Re-encode a fixed random sample with the float32 model and compare. Cosine is per-row scale invariant,
+    # so X may be the stored float16/int8 matrix as is.
+    if not isinstance(encoder, QuantizedEncoder) or n_rows <= 0 or len(texts) == 0:
+        return None
+    rng = np.random.default_rng(seed)
+    idx = np.sort(rng.choice(len(texts), size=min(n_rows, len(texts)), replace=False))
+    check = encoder.agreement([texts[i] for i in idx], np.asarray(X[idx], dtype=np.float32))
+    print(
+        f"[INFO] int8 vs float32 cosine on {check['rows']} rows: "
+        f"mean={check['cosine_mean']:.4f} p05={check['cosine_p05']:.4f} min={check['cosine_min']:.4f}"
+    )
+    return check
+
+def throughput(stats: dict) -> str:
+    secs = float(stats.get("encode_seconds", 0.0))
+    rate = stats["encoded"] / secs if secs > 0 else 0.0
+    return f"encoded {stats['encoded']} texts in {secs:.1f}s ({rate:.1f} rows/s)"
+
+def _write_json_atomic(path: str, obj: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def run_streaming(cfg: dict, encoder: LazyEncoder, cache: EmbeddingCache | None, batch_size: int, batch_opts: dict):
+    # Reads the input in chunks, appends cleaned rows to processed_csv and writes each batch straight
+    # into a preallocated .npy memmap. A checkpoint after every batch lets an interrupted run resume.
+    input_csv = cfg["paths"]["input_csv"]
+    processed_csv = cfg["paths"]["processed_csv"]
+    out_path = embedding_path(cfg)
+    out_npy = cfg["paths"].get("embedding_npy") or os.path.splitext(cfg["paths"]["embedding_npz"])[0] + ".npy"
+    storage_dtype = str(cfg["embedding"].get("storage_dtype", "float32")) if out_path == out_npy else "float32"
+    ckpt_path = out_npy + ".progress.json"
+    text_col = cfg["text"]["text_column"]
+    optional_meta = cfg["text"].get("optional_meta_columns", [])
+    chunk_rows = int(cfg["embedding"].get("read_chunk_rows", 10000))
+
+    header = pd.read_csv(input_csv, nrows=0).columns
+    if text_col not in header:
+        raise SystemExit(f"text column not found: {text_col}")
+    keep_cols = [c for c in optional_meta if c in header]
+    usecols = [text_col] + keep_cols
+
+    # Pass 1 (text column only): number of non-empty rows, to preallocate the memmap.
+    n_rows = 0
+    for chunk in pd.read_csv(input_csv, usecols=[text_col], chunksize=chunk_rows):
+        n_rows += int((clean_texts(chunk[text_col]).str.len() > 0).sum())
+
+    st = os.stat(input_csv)
+    fingerprint = {
+        "input_csv": os.path.abspath(input_csv),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "n_rows": n_rows,
+        "columns": usecols,
+        "model_name": encoder.model_name,
+        "e5_prefix": encoder.prefix,
+        "normalize": encoder.normalize,
+        "storage_dtype": storage_dtype,
+    }
+    if encoder.variant:
+        fingerprint["variant"] = encoder.variant
+
+    ckpt = None
+    if os.path.exists(ckpt_path) and os.path.exists(out_npy) and os.path.exists(processed_csv):
+        with open(ckpt_path, "r", encoding="utf-8") as f:
+            prev = json.load(f)
+        if prev.get("fingerprint") == fingerprint:
+            ckpt = prev
+    ensure_dir(out_npy)
+    os.makedirs(os.path.dirname(processed_csv), exist_ok=True)
+
+    writer = None
+    rows_done = 0
+    if ckpt is not None:
+        rows_done = int(ckpt["rows_done"])
+        writer = NpyEmbeddingWriter(out_npy, (n_rows, 0), storage_dtype, resume=True)
+        # Drop CSV rows written after the last checkpoint.
+        with open(processed_csv, "r+b") as f:
+            f.truncate(int(ckpt["csv_bytes"]))
+        print(f"[INFO] resuming from row {rows_done}/{n_rows}")
+    else:
+        pd.DataFrame(columns=usecols).to_csv(processed_csv, index=False)
+
+    stats = {"rows": 0, "unique": 0, "cached": 0, "encoded": 0, "encode_seconds": 0.0}
+    # A pool backend needs several batches in flight, so each step (and checkpoint) covers one batch per worker.
+    step = batch_size * encoder.workers
+    seen = 0
+    pbar = tqdm(total=n_rows, initial=rows_done, desc="embedding")
+    for chunk in pd.read_csv(input_csv, usecols=usecols, chunksize=chunk_rows):
+        chunk = chunk[usecols].copy()
+        chunk[text_col] = clean_texts(chunk[text_col])
+        chunk = chunk[chunk[text_col].str.len() > 0].reset_index(drop=True)
+        start = max(0, rows_done - seen)
+        seen += len(chunk)
+        for i in range(start, len(chunk), step):
+            part = chunk.iloc[i:i+step]
+            X, s = embed_with_cache(part[text_col].tolist(), encoder, cache, batch_size, **batch_opts)
+            for k in stats:
+                stats[k] += s[k]
+            if writer is None:
+                writer = NpyEmbeddingWriter(out_npy, (n_rows, X.shape[1]), storage_dtype)
+            writer.write(rows_done, X)
+            writer.flush()
+            part.to_csv(processed_csv, mode="a", header=False, index=False)
+            rows_done += len(part)
+            pbar.update(len(part))
+            _write_json_atomic(ckpt_path, {
+                "fingerprint": fingerprint,
+                "rows_done": rows_done,
+                "csv_bytes": os.path.getsize(processed_csv),
+            })
+    pbar.close()
+
+    if writer is None:
+        raise SystemExit("no non-empty texts to embed")
+    writer.flush()
+    check = None
+    if isinstance(encoder, QuantizedEncoder):
+        texts = pd.read_csv(processed_csv, usecols=[text_col], keep_default_na=False)[text_col].astype(str).tolist()
+        check = quantization_check(
+            encoder, texts, writer.data, int(cfg["embedding"].get("quant_check_rows", 256)), int(cfg["project"]["seed"])
+        )
+    write_meta(out_npy, writer.shape, storage_dtype, embedding_meta(encoder, check))
+    if out_path != out_npy:
+        # savez writes the memmap in buffered blocks, so this does not load the whole matrix.
+        ensure_dir(out_path)
+        np.savez_compressed(out_path, embeddings=writer.data)
+        write_meta(out_path, writer.shape, "float32", embedding_meta(encoder, check))
+    os.remove(ckpt_path)
+    print(f"[INFO] {json_dumps_compact(stats)}")
+    print(f"[INFO] {throughput(stats)}")
+    return out_path, writer.shape
+
+def run_embedding(cfg: dict, persist: bool = True) -> tuple[pd.DataFrame, np.ndarray]:
+    # The embed stage: cleaned text frame (text + optional meta columns) and its embedding matrix.
+    # persist=False keeps both in memory only; streaming mode always goes through processed_csv / .npy.
+    seed = int(cfg["project"]["seed"])
+    np.random.seed(seed)
+
+    input_csv = cfg["paths"]["input_csv"]
+    processed_csv = cfg["paths"]["processed_csv"]
+
+    text_col = cfg["text"]["text_column"]
+    optional_meta = cfg["text"].get("optional_meta_columns", [])
+
+    emb_cfg = cfg["embedding"]
+    model_name = emb_cfg["model_name"]
+    batch_size = int(emb_cfg["batch_size"])
+    device = str(emb_cfg.get("device", "auto"))  # "auto" is resolved by the encoder if it has to load the model
+    normalize = bool(emb_cfg.get("normalize", True))
+    prefix = emb_cfg.get("e5_prefix", "")
+
+    encoder = make_encoder(emb_cfg, device)
+    batch_opts = {
+        "batching": str(emb_cfg.get("batching", "fixed")),
+        "max_tokens_per_batch": int(emb_cfg.get("max_tokens_per_batch", 8192)),
+    }
+    cache_db = cfg["paths"].get("embedding_cache_db")
+    cache = EmbeddingCache(cache_db, model_name, prefix, normalize, variant=encoder.variant) if cache_db else None
+
+    if bool(emb_cfg.get("streaming", False)):
+        try:
+            out_path, shape = run_streaming(cfg, encoder, cache, batch_size, batch_opts)
+        finally:
+            encoder.close()
+        if cache is not None:
+            cache.close()
+        print(f"[OK] saved embeddings: {out_path} shape={shape} device={encoder.device} model={model_name}")
+        return pd.read_csv(processed_csv), load_embeddings(out_path)
+
+    df = pd.read_csv(input_csv)
+    df = df.copy()
+    df[text_col] = clean_texts(df[text_col])
+    df = df[df[text_col].str.len() > 0].reset_index(drop=True)
+
+    keep_cols = [c for c in optional_meta if c in df.columns]
+    out_df = df[[text_col] + keep_cols].copy()
+    if persist:
+        os.makedirs(os.path.dirname(processed_csv), exist_ok=True)
+        out_df.to_csv(processed_csv, index=False)
+
+    try:
+        X, stats = embed_with_cache(out_df[text_col].tolist(), encoder, cache, batch_size, progress=True, **batch_opts)
+    finally:
+        encoder.close()
+    if cache is not None:
+        cache.close()
+    print(f"[INFO] {json_dumps_compact(stats)}")
+    print(f"[INFO] {throughput(stats)}")
+    check = quantization_check(encoder, out_df[text_col].tolist(), X, int(emb_cfg.get("quant_check_rows", 256)), seed)
+
+    if persist:
+        out_path = embedding_path(cfg)
+        storage_dtype = str(emb_cfg.get("storage_dtype", "float32"))
+        save_embeddings(out_path, X, storage_dtype, embedding_meta(encoder, check))
+        print(f"[OK] saved embeddings: {out_path} ({storage_dtype}) shape={X.shape} device={encoder.device} model={model_name}")
+    else:
+        print(f"[OK] embeddings in memory: shape={X.shape} device={encoder.device} model={model_name}")
+    return out_df, X
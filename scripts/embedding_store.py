@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Iterator
+
+import numpy as np
+
+# Embedding artifacts:
+# - "npz": outputs/embeddings/embeddings.npz (compressed, float32; the original format)
+# - "npy": uncompressed .npy opened with mmap_mode="r", stored as float32 / float16 / int8.
+#          int8 keeps a per-row float32 scale in "<path>.scale.npy".
+# Both get a small "<path>.meta.json" sidecar (shape, storage dtype, embedding settings).
+EMBEDDING_FORMATS = ("npz", "npy")
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def embedding_path(cfg: dict) -> str:
+    fmt = str(cfg.get("embedding", {}).get("format", "npz"))
+    if fmt not in EMBEDDING_FORMATS:
+        raise ValueError(f"unknown embedding.format: {fmt}")
+    if fmt == "npy":
+        return cfg["paths"].get("embedding_npy") or os.path.splitext(cfg["paths"]["embedding_npz"])[0] + ".npy"
+    return cfg["paths"]["embedding_npz"]
+
+
+def meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def scale_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".scale.npy"
+
+
+def read_meta(path: str) -> dict[str, Any]:
+    if not os.path.exists(meta_path(path)):
+        return {}
+    with open(meta_path(path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(path: str, shape: tuple[int, ...], storage_dtype: str, extra: dict[str, Any] | None = None) -> None:
+    meta = {
+        "format": "npy" if path.endswith(".npy") else "npz",
+        "shape": [int(n) for n in shape],
+        "storage_dtype": storage_dtype,
+        **(extra or {}),
+    }
+    tmp = meta_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, meta_path(path))
+
+
+def quantize(X: np.ndarray, storage_dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    if storage_dtype not in STORAGE_DTYPES:
+        raise ValueError(f"unknown storage dtype: {storage_dtype}")
+    X = np.asarray(X, dtype=np.float32)
+    if storage_dtype != "int8":
+        return X.astype(STORAGE_DTYPES[storage_dtype], copy=False), None
+    # symmetric per-row scale
+    scale = np.abs(X).max(axis=1) / 127.0 if X.size else np.zeros((X.shape[0],), dtype=np.float32)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    q = np.clip(np.rint(X / scale[:, None]), -127, 127).astype(np.int8)
+    return q, scale
+
+
+class NpyEmbeddingWriter:
+    """Row-block writer into a preallocated .npy memmap (used by streaming 01_embed)."""
+
+    def __init__(self, path: str, shape: tuple[int, int], storage_dtype: str = "float32", resume: bool = False):
+        self.path = path
+        self.storage_dtype = storage_dtype
+        mode = "r+" if resume else "w+"
+        if resume:
+            self.data = np.lib.format.open_memmap(path, mode=mode)
+        else:
+            self.data = np.lib.format.open_memmap(path, mode=mode, dtype=STORAGE_DTYPES[storage_dtype], shape=shape)
+        self.scale = None
+        if storage_dtype == "int8":
+            if resume:
+                self.scale = np.lib.format.open_memmap(scale_path(path), mode=mode)
+            else:
+                self.scale = np.lib.format.open_memmap(scale_path(path), mode=mode, dtype=np.float32, shape=(shape[0],))
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(self.data.shape)
+
+    def write(self, start: int, X: np.ndarray) -> None:
+        q, scale = quantize(X, self.storage_dtype)
+        self.data[start:start + len(q)] = q
+        if self.scale is not None:
+            self.scale[start:start + len(q)] = scale
+
+    def flush(self) -> None:
+        self.data.flush()
+        if self.scale is not None:
+            self.scale.flush()
+
+
+def save_embeddings(path: str, X: np.ndarray, storage_dtype: str = "float32", meta: dict[str, Any] | None = None) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".npz"):
+        if storage_dtype != "float32":
+            raise ValueError("embedding.storage_dtype other than float32 requires embedding.format: npy")
+        np.savez_compressed(path, embeddings=np.asarray(X, dtype=np.float32))
+    else:
+        q, scale = quantize(X, storage_dtype)
+        np.save(path, q)
+        if scale is not None:
+            np.save(scale_path(path), scale)
+    write_meta(path, X.shape, storage_dtype, meta)
+
+
+def open_embeddings(path: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Raw stored matrix (memory-mapped for .npy) and the int8 row scales, if any."""
+    if path.endswith(".npz"):
+        z = np.load(path)
+        if "embeddings" not in z.files:
+            raise SystemExit(f"embeddings not found in npz: {path}")
+        return z["embeddings"], None
+    data = np.load(path, mmap_mode="r")
+    scale = None
+    if data.dtype == np.int8:
+        scale = np.load(scale_path(path), mmap_mode="r")
+    return data, scale
+
+
+def iter_embedding_blocks(path: str, block_rows: int = 8192) -> Iterator[tuple[int, np.ndarray]]:
+    """Yield (start_row, float32 block) without materializing the whole matrix."""
+    data, scale = open_embeddings(path)
+    for start in range(0, data.shape[0], block_rows):
+        block = np.asarray(data[start:start + block_rows], dtype=np.float32)
+        if scale is not None:
+            block *= np.asarray(scale[start:start + block_rows], dtype=np.float32)[:, None]
+        yield start, block
+
+
+def load_embeddings(path: str, block_rows: int = 8192) -> np.ndarray:
+    """float32 embedding matrix for downstream stages.
+
+    float32 .npy is returned as a read-only memmap (zero-copy); float16/int8 are upcast block by
+    block into one float32 array, so there is never a second full-size temporary.
+    """
+    data, scale = open_embeddings(path)
+    if data.dtype == np.float32 and scale is None:
+        return data
+    if path.endswith(".npz"):
+        return data.astype(np.float32)
+    X = np.empty(data.shape, dtype=np.float32)
+    for start, block in iter_embedding_blocks(path, block_rows=block_rows):
+        X[start:start + len(block)] = block
+    return X
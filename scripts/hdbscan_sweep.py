@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any
+
+import numpy as np
+
+# min_cluster_size sweep (cluster.hdbscan.sweep): the mutual-reachability MST and single-linkage tree
+# depend only on min_samples / metric, so they are built once (from the shared kNN graph when it fits,
+# else by hdbscan itself) and every min_cluster_size is just a condense + flat extraction of that tree.
+# Per value: cluster count, noise ratio, hdbscan's MST-based DBCV approximation (relative_validity_)
+# and the summed cluster stability.
+SWEEP_SELECT = ("validity", "min_cluster_size")
+
+
+def hdbscan_params(hcfg: dict) -> dict[str, Any]:
+    """hdbscan.HDBSCAN keyword arguments from cluster.hdbscan (algorithm / core_dist_n_jobs as in hdbscan when unset)."""
+    return {
+        "min_cluster_size": int(hcfg["min_cluster_size"]),
+        "min_samples": int(hcfg["min_samples"]),
+        "metric": str(hcfg.get("metric", "euclidean")),
+        "algorithm": str(hcfg.get("algorithm", "best")),
+        "core_dist_n_jobs": int(hcfg.get("core_dist_n_jobs", 4)),
+    }
+
+
+def hdbscan_hierarchy(X: np.ndarray, hcfg: dict, knn=None) -> tuple[np.ndarray, np.ndarray, str]:
+    """(MST rows (i, j, mutual reachability), single-linkage tree, source) for hcfg's min_samples / metric."""
+    if knn is not None:
+        from knn_graph import knn_hierarchy
+
+        tree = knn_hierarchy(X, knn, hcfg)
+        if tree is not None:
+            return tree[0], tree[1], "knn_graph"
+        print(f"[INFO] hdbscan: kNN graph (k={knn.k}, metric={knn.metric}) does not fit hdbscan settings")
+    import hdbscan
+
+    clusterer = hdbscan.HDBSCAN(**hdbscan_params(hcfg), gen_min_span_tree=True).fit(X)
+    return clusterer._min_spanning_tree, clusterer.single_linkage_tree_.to_numpy(), "hdbscan"
+
+
+def relative_validity(labels: np.ndarray, mst: np.ndarray) -> float:
+    """hdbscan's HDBSCAN.relative_validity_ (DBCV approximated on the MST) for any labelling of the MST's rows."""
+    labels = np.asarray(labels)
+    num_clusters = int(labels.max()) + 1 if len(labels) else 0
+    if num_clusters == 0:
+        return float("nan")
+    sizes = np.bincount(labels + 1)
+    noise_size, cluster_size = sizes[0], sizes[1:]
+    total = noise_size + np.sum(cluster_size)
+    dsc = np.zeros(num_clusters)
+    dspc_wrt = np.full(num_clusters, np.inf)
+    min_outlier_sep = np.inf
+
+    edge_from = mst[:, 0].astype(np.intp)
+    edge_to = mst[:, 1].astype(np.intp)
+    edge_dist = mst[:, 2]
+    label1, label2 = labels[edge_from], labels[edge_to]
+    max_distance = edge_dist.max() if len(edge_dist) else 0.0
+
+    both_noise = (label1 == -1) & (label2 == -1)
+    one_noise = (label1 == -1) ^ (label2 == -1)
+    neither_noise = ~both_noise & ~one_noise
+    if one_noise.any():
+        min_outlier_sep = edge_dist[one_noise].min()
+    same = neither_noise & (label1 == label2)
+    diff = neither_noise & (label1 != label2)
+    if same.any():
+        np.maximum.at(dsc, label1[same], edge_dist[same])
+    if diff.any():
+        np.minimum.at(dspc_wrt, label1[diff], edge_dist[diff])
+        np.minimum.at(dspc_wrt, label2[diff], edge_dist[diff])
+
+    min_outlier_sep = max_distance if min_outlier_sep == np.inf else min_outlier_sep
+    dspc_wrt[dspc_wrt == np.inf] = 2 * (max_distance if num_clusters > 1 else min_outlier_sep)
+    denom = np.maximum(dspc_wrt, dsc)
+    v = np.divide(dspc_wrt - dsc, denom, out=np.zeros(num_clusters), where=denom > 0)
+    return float(np.sum(cluster_size / total * v))
+
+
+def sweep_hdbscan(
+    X: np.ndarray, hcfg: dict, knn=None, sizes: list[int] | None = None, select: str | None = None
+) -> tuple[np.ndarray, dict[str, Any], list[dict[str, Any]]]:
+    """(labels of the chosen min_cluster_size, info, one report row per min_cluster_size)."""
+    from hdbscan.hdbscan_ import _tree_to_labels
+
+    sizes = sorted({int(v) for v in (sizes if sizes is not None else hcfg.get("sweep") or [])})
+    select = str(select or hcfg.get("select", "validity"))
+    if select not in SWEEP_SELECT:
+        raise ValueError(f"unknown cluster.hdbscan.select: {select} (expected one of {', '.join(SWEEP_SELECT)})")
+    configured = int(hcfg["min_cluster_size"])
+    if configured not in sizes:
+        sizes = sorted([*sizes, configured])
+
+    t0 = time.perf_counter()
+    mst, slt, source = hdbscan_hierarchy(X, hcfg, knn=knn)
+    tree_seconds = time.perf_counter() - t0
+    print(f"[INFO] hdbscan: hierarchy for min_samples={hcfg['min_samples']} from {source} in {tree_seconds:.1f}s")
+
+    labels_by_size: dict[int, np.ndarray] = {}
+    rows: list[dict[str, Any]] = []
+    n = len(X)
+    for mcs in sizes:
+        t1 = time.perf_counter()
+        labels, probabilities, stabilities, *_ = _tree_to_labels(None, slt, min_cluster_size=mcs)
+        labels_by_size[mcs] = labels
+        rows.append(
+            {
+                "min_cluster_size": mcs,
+                "n_clusters": int(labels.max()) + 1 if n else 0,
+                "n_noise": int((labels == -1).sum()),
+                "noise_ratio": float((labels == -1).mean()) if n else 0.0,
+                "relative_validity": relative_validity(labels, mst),
+                "stability_sum": float(np.sum(stabilities)) if len(stabilities) else 0.0,
+                "mean_probability": float(probabilities[labels >= 0].mean()) if (labels >= 0).any() else 0.0,
+                "seconds": time.perf_counter() - t1,
+            }
+        )
+
+    if select == "min_cluster_size":
+        chosen = configured
+    else:
+        scored = [r for r in rows if np.isfinite(r["relative_validity"]) and r["n_clusters"] > 0]
+        chosen = max(scored, key=lambda r: (r["relative_validity"], -r["min_cluster_size"]))["min_cluster_size"] if scored else configured
+    for r in rows:
+        r["chosen"] = r["min_cluster_size"] == chosen
+    labels = labels_by_size[chosen]
+    info = {
+        "min_cluster_size": int(chosen),
+        "select": select,
+        "swept": len(sizes),
+        "hierarchy": source,
+        "hierarchy_seconds": round(tree_seconds, 3),
+        "n_clusters": int(labels.max()) + 1 if n else 0,
+        "n_noise": int((labels == -1).sum()),
+    }
+    return labels, info, rows
+
+
+def hdbscan_report_path(cfg: dict) -> str:
+    return str(cfg["paths"].get("hdbscan_sweep_report") or os.path.join(os.path.dirname(cfg["paths"]["cluster_csv"]), "hdbscan_sweep.csv"))
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Iterator
+
+from axis_scoring import json_dumps_compact, stable_text_hash
+
+
+def prompt_hash(system: str, user_tpl: str) -> str:
+    return stable_text_hash(system + "\n\0\n" + user_tpl)
+
+
+class JudgeCache:
+    """Judge results in SQLite (WAL), keyed by (text_hash, model, prompt_hash).
+
+    Lookups are point queries on the primary key, so nothing is loaded up front. Writes are
+    buffered and committed every `commit_every` results; WAL plus a busy timeout lets several
+    processes share one cache file.
+    """
+
+    def __init__(self, path: str, commit_every: int = 20, timeout_s: float = 60.0):
+        self.path = path
+        self.commit_every = max(1, int(commit_every))
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout_s, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={int(timeout_s * 1000)}")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS judge_cache (
+                text_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                row_index INTEGER,
+                session_id TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (text_hash, model, prompt_hash)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS imports (
+                source TEXT PRIMARY KEY,
+                n_rows INTEGER NOT NULL,
+                imported_at REAL NOT NULL
+            );
+            """
+        )
+        self._pending: list[tuple[Any, ...]] = []
+
+    def get(self, text_hash: str, model: str, prompt_hash: str) -> dict[str, Any] | None:
+        row = self._conn.execute(
+            "SELECT result FROM judge_cache WHERE text_hash = ? AND model = ? AND prompt_hash = ?",
+            (text_hash, model, prompt_hash),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(
+        self,
+        text_hash: str,
+        model: str,
+        prompt_hash: str,
+        result: dict[str, Any],
+        row_index: int | None = None,
+        session_id: Any = None,
+    ) -> None:
+        self._pending.append(
+            (
+                text_hash,
+                model,
+                prompt_hash,
+                json_dumps_compact(result),
+                row_index,
+                None if session_id is None else str(session_id),
+                time.time(),
+            )
+        )
+        if len(self._pending) >= self.commit_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO judge_cache "
+                "(text_hash, model, prompt_hash, result, row_index, session_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def import_jsonl(self, path: str, prompt_hash: str) -> int:
+        """One-time import of a legacy judge_cache.jsonl.
+
+        Legacy rows carry no prompt hash; they are filed under `prompt_hash` (the prompt of the
+        current code) and keep their recorded model. Existing entries are not overwritten.
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        source = os.path.abspath(path)
+        if self._conn.execute("SELECT 1 FROM imports WHERE source = ?", (source,)).fetchone():
+            return 0
+
+        rows: list[tuple[Any, ...]] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                r = json.loads(line)
+                text_hash = r.get("text_hash")
+                model = r.get("model")
+                result = r.get("result")
+                if not isinstance(text_hash, str) or not isinstance(model, str) or not isinstance(result, dict):
+                    continue
+                session_id = r.get("session_id")
+                rows.append(
+                    (
+                        text_hash,
+                        model,
+                        prompt_hash,
+                        json_dumps_compact(result),
+                        r.get("row_index"),
+                        None if session_id is None else str(session_id),
+                        time.time(),
+                    )
+                )
+
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO judge_cache "
+                "(text_hash, model, prompt_hash, result, row_index, session_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imports (source, n_rows, imported_at) VALUES (?, ?, ?)",
+                (source, len(rows), time.time()),
+            )
+        return len(rows)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # IMMEDIATE takes the write lock up front, so concurrent writers wait on busy_timeout
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._conn.close()
+
+    def __enter__(self) -> "JudgeCache":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
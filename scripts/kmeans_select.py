@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import concurrent.futures
+import os
+import time
+from typing import Any
+
+import numpy as np
+
+# KMeans model selection over k = k_min..k_max (cluster.kmeans):
+# - algorithm: kmeans | minibatch (MiniBatchKMeans, `batch_size` rows per step)
+# - warm_start: k is initialised from the k-1 centroids with the highest-SSE cluster split in two, so
+#   each fit starts close to convergence; fits then run in order while the silhouettes of finished k run in
+#   parallel. Without warm start whole (fit + score) jobs for different k run in parallel.
+# - silhouette_sample: silhouette on a fixed-seed row sample (the same rows for every k); 0 = all rows.
+# The best k is the highest silhouette (ties: smaller k).
+KMEANS_ALGORITHMS = ("kmeans", "minibatch")
+
+
+def _model(k: int, kcfg: dict, init: np.ndarray | None):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    seed = int(kcfg["random_state"])
+    algo = str(kcfg.get("algorithm", "kmeans"))
+    init_kw: dict[str, Any] = {"init": init, "n_init": 1} if init is not None else {"n_init": "auto"}
+    if algo == "kmeans":
+        return KMeans(n_clusters=k, random_state=seed, **init_kw)
+    if algo == "minibatch":
+        return MiniBatchKMeans(n_clusters=k, random_state=seed, batch_size=int(kcfg.get("batch_size", 4096)), **init_kw)
+    raise ValueError(f"unknown cluster.kmeans.algorithm: {algo} (expected one of {', '.join(KMEANS_ALGORITHMS)})")
+
+
+def _next_init(X: np.ndarray, model, seed: int, sample: int = 20000) -> np.ndarray:
+    """Previous centroids with the highest-SSE cluster split in two (a 2-means on its rows), as in bisecting k-means."""
+    from sklearn.cluster import KMeans
+
+    centers = np.asarray(model.cluster_centers_, dtype=np.float64)
+    labels = np.asarray(model.labels_)
+    sq = np.empty(len(labels), dtype=np.float64)
+    for start in range(0, len(labels), 65536):
+        block = np.asarray(X[start:start + 65536], dtype=np.float64)
+        sq[start:start + len(block)] = ((block - centers[labels[start:start + len(block)]]) ** 2).sum(axis=1)
+    worst = int(np.argmax(np.bincount(labels, weights=sq, minlength=len(centers))))
+    members = np.flatnonzero(labels == worst)
+    if len(members) > sample:
+        members = np.sort(np.random.default_rng(seed).choice(members, size=sample, replace=False))
+    if len(members) < 2:
+        return np.vstack([centers, centers[worst][None, :]])
+    halves = KMeans(n_clusters=2, random_state=seed, n_init=1).fit(np.asarray(X[members], dtype=np.float64)).cluster_centers_
+    return np.vstack([np.delete(centers, worst, axis=0), halves])
+
+
+def _silhouette(X: np.ndarray, labels: np.ndarray, sample: int, seed: int) -> float:
+    from sklearn.metrics import silhouette_score
+
+    if len(np.unique(labels)) < 2:
+        return float("nan")
+    n = int(X.shape[0])
+    if sample <= 0 or sample >= n:
+        return float(silhouette_score(X, labels, metric="euclidean"))
+    # an int random_state draws the same rows for every k
+    return float(silhouette_score(X, labels, metric="euclidean", sample_size=sample, random_state=seed))
+
+
+def _fit(X: np.ndarray, k: int, kcfg: dict, init: np.ndarray | None) -> tuple[Any, dict[str, Any]]:
+    t0 = time.perf_counter()
+    model = _model(k, kcfg, init).fit(X)
+    return model, {
+        "k": k,
+        "inertia": float(model.inertia_),
+        "n_iter": int(model.n_iter_),
+        "warm_start": init is not None,
+        "fit_seconds": time.perf_counter() - t0,
+    }
+
+
+def _score(X: np.ndarray, labels: np.ndarray, row: dict[str, Any], sample: int, seed: int) -> dict[str, Any]:
+    t0 = time.perf_counter()
+    row["silhouette"] = _silhouette(X, labels, sample, seed)
+    row["silhouette_seconds"] = time.perf_counter() - t0
+    return row
+
+
+def select_kmeans(X: np.ndarray, kcfg: dict) -> tuple[np.ndarray, dict[str, Any], list[dict[str, Any]]]:
+    """(labels of the best k, info, one report row per k)."""
+    from threadpoolctl import threadpool_limits
+
+    kmin, kmax = int(kcfg["k_min"]), int(kcfg["k_max"])
+    seed = int(kcfg["random_state"])
+    sample = int(kcfg.get("silhouette_sample", 0))
+    warm = bool(kcfg.get("warm_start", False))
+    jobs = int(kcfg.get("n_jobs", 1))
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    ks = list(range(kmin, kmax + 1))
+    jobs = max(1, min(jobs, len(ks)))
+    X = np.asarray(X, dtype=np.float32)
+    labels_by_k: dict[int, np.ndarray] = {}
+    rows: list[dict[str, Any]] = []
+
+    # keep jobs x BLAS/OpenMP threads at about the core count
+    with threadpool_limits(limits=max(1, (os.cpu_count() or 1) // jobs)), concurrent.futures.ThreadPoolExecutor(jobs) as ex:
+        if warm:
+            futures = []
+            model = None
+            for k in ks:
+                init = _next_init(X, model, seed + k) if model is not None else None
+                model, row = _fit(X, k, kcfg, init)
+                labels_by_k[k] = model.labels_
+                futures.append(ex.submit(_score, X, model.labels_, row, sample, seed))
+            rows = [f.result() for f in futures]
+        else:
+
+            def job(k: int) -> dict[str, Any]:
+                model, row = _fit(X, k, kcfg, None)
+                labels_by_k[k] = model.labels_
+                return _score(X, model.labels_, row, sample, seed)
+
+            rows = list(ex.map(job, ks))
+
+    scored = [r for r in rows if np.isfinite(r["silhouette"])]
+    if not scored:
+        raise ValueError(f"no k in {kmin}..{kmax} produced two or more clusters")
+    best = max(scored, key=lambda r: (r["silhouette"], -r["k"]))
+    for r in rows:
+        r["best"] = r["k"] == best["k"]
+    info = {
+        "best_k": int(best["k"]),
+        "silhouette": float(best["silhouette"]),
+        "silhouette_sample": sample if 0 < sample < len(X) else len(X),
+        "algorithm": str(kcfg.get("algorithm", "kmeans")),
+    }
+    return labels_by_k[best["k"]], info, rows
+
+
+def kmeans_report_path(cfg: dict) -> str:
+    return str(cfg["paths"].get("kmeans_report") or os.path.join(os.path.dirname(cfg["paths"]["cluster_csv"]), "kmeans_selection.csv"))
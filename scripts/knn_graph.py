@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+# Shared approximate kNN graph over the embedding matrix (paths.knn_graph, default outputs/knn/knn_graph.npz):
+#   indices   (n, k) int32   column 0 is the row itself, then neighbours by increasing distance
+#   distances (n, k) float32 in `metric`
+# plus a "<path>.meta.json" sidecar (k, metric, shape and a fingerprint of the embeddings).
+# Built once with NN-descent (umap's own nearest_neighbors) and reused by UMAP (precomputed_knn) and by
+# HDBSCAN (core distances and the mutual-reachability MST are taken from the graph instead of a
+# full-dimensional tree search).
+KNN_METRICS = ("cosine", "euclidean")
+FINGERPRINT_BLOCK_ROWS = 65536
+
+
+@dataclass
+class KnnGraph:
+    indices: np.ndarray
+    distances: np.ndarray
+    metric: str
+
+    @property
+    def k(self) -> int:
+        return int(self.indices.shape[1])
+
+    def distances_as(self, metric: str, unit_norm: bool) -> np.ndarray | None:
+        """Distances in another metric when that keeps the neighbour order (cosine <-> euclidean on unit rows)."""
+        if metric == self.metric:
+            return self.distances
+        if not unit_norm or {metric, self.metric} != set(KNN_METRICS):
+            return None
+        d = self.distances.astype(np.float64)
+        # |a - b|^2 = 2 - 2 cos(a, b) = 2 * cosine_distance for unit vectors
+        out = np.sqrt(np.maximum(2.0 * d, 0.0)) if metric == "euclidean" else d * d / 2.0
+        return out.astype(np.float32)
+
+
+def knn_graph_path(cfg: dict) -> str:
+    return str(cfg["paths"].get("knn_graph") or "")
+
+
+def knn_enabled(cfg: dict) -> bool:
+    return bool((cfg.get("knn") or {}).get("enabled", False)) and bool(knn_graph_path(cfg))
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def embedding_fingerprint(X: np.ndarray, block_rows: int = FINGERPRINT_BLOCK_ROWS) -> str:
+    """Identity check for "was this built from these embeddings": sha1 over the shape and every row (as float32).
+
+    Hashed block by block, so a memory-mapped .npy is streamed instead of loaded; a change in any row is caught.
+    """
+    n = int(X.shape[0])
+    h = hashlib.sha1(json.dumps([int(s) for s in X.shape]).encode("utf-8"))
+    for start in range(0, n, block_rows):
+        h.update(np.ascontiguousarray(np.asarray(X[start:start + block_rows], dtype=np.float32)).tobytes())
+    return h.hexdigest()
+
+
+def is_unit_norm(X: np.ndarray, rows: int = 256, tol: float = 1e-3) -> bool:
+    n = int(X.shape[0])
+    if n == 0:
+        return True
+    take = np.unique(np.linspace(0, n - 1, num=min(n, rows)).astype(np.int64))
+    norms = np.linalg.norm(np.asarray(X[take], dtype=np.float32), axis=1)
+    return bool(np.all(np.abs(norms - 1.0) < tol))
+
+
+def build_knn_graph(X: np.ndarray, kcfg: dict) -> KnnGraph:
+    from umap.umap_ import nearest_neighbors
+
+    metric = str(kcfg.get("metric", "cosine"))
+    if metric not in KNN_METRICS:
+        raise ValueError(f"unknown knn.metric: {metric} (expected one of {', '.join(KNN_METRICS)})")
+    k = min(int(kcfg.get("n_neighbors", 30)), int(X.shape[0]))
+    seed = kcfg.get("random_state", None)
+    indices, distances, _ = nearest_neighbors(
+        np.asarray(X, dtype=np.float32),
+        k,
+        metric,
+        {},
+        False,
+        np.random.RandomState(int(seed)) if seed is not None else np.random.RandomState(),
+        low_memory=bool(kcfg.get("low_memory", True)),
+        n_jobs=int(kcfg.get("n_jobs", -1)),
+    )
+    return KnnGraph(indices.astype(np.int32), distances.astype(np.float32), metric)
+
+
+def save_knn_graph(path: str, graph: KnnGraph, X: np.ndarray) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, indices=graph.indices, distances=graph.distances)
+    os.replace(tmp, path)
+    meta = {
+        "k": graph.k,
+        "metric": graph.metric,
+        "shape": [int(s) for s in X.shape],
+        "embedding_fingerprint": embedding_fingerprint(X),
+        "method": "nn-descent (umap.umap_.nearest_neighbors)",
+    }
+    with open(_meta_path(path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(_meta_path(path) + ".tmp", _meta_path(path))
+
+
+def load_knn_graph(path: str, X: np.ndarray) -> KnnGraph | None:
+    """The saved graph, or None when it is missing or was built from different embeddings."""
+    if not path or not os.path.exists(path) or not os.path.exists(_meta_path(path)):
+        return None
+    with open(_meta_path(path), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if list(meta.get("shape", [])) != [int(s) for s in X.shape] or meta.get("embedding_fingerprint") != embedding_fingerprint(X):
+        print(f"[INFO] kNN graph {path} was built from other embeddings; ignoring it")
+        return None
+    with np.load(path) as z:
+        return KnnGraph(z["indices"], z["distances"], str(meta["metric"]))
+
+
+def _pairwise(A: np.ndarray, B: np.ndarray, metric: str) -> np.ndarray:
+    A = np.asarray(A, dtype=np.float32)
+    B = np.asarray(B, dtype=np.float32)
+    G = A @ B.T
+    if metric == "cosine":
+        na = np.linalg.norm(A, axis=1)
+        nb = np.linalg.norm(B, axis=1)
+        return 1.0 - G / np.maximum(np.outer(na, nb), 1e-12)
+    sq = (A * A).sum(axis=1)[:, None] + (B * B).sum(axis=1)[None, :] - 2.0 * G
+    return np.sqrt(np.maximum(sq, 0.0))
+
+
+def _component_links(
+    X: np.ndarray, comp: np.ndarray, n_comp: int, metric: str, block_rows: int = 8192
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One edge from each component (its member closest to the centroid) to the nearest row outside it."""
+    reps = np.empty(n_comp, dtype=np.int64)
+    for c in range(n_comp):
+        members = np.flatnonzero(comp == c)
+        block = np.asarray(X[members], dtype=np.float32)
+        reps[c] = members[int(np.argmin(_pairwise(block.mean(axis=0, keepdims=True), block, metric)[0]))]
+    R = np.asarray(X[reps], dtype=np.float32)
+    best_d = np.full(n_comp, np.inf)
+    best_j = np.full(n_comp, -1, dtype=np.int64)
+    for start in range(0, int(X.shape[0]), block_rows):
+        D = _pairwise(R, X[start:start + block_rows], metric)
+        D[comp[None, start:start + block_rows] == np.arange(n_comp)[:, None]] = np.inf
+        j = np.argmin(D, axis=1)
+        d = D[np.arange(n_comp), j]
+        better = d < best_d
+        best_d[better] = d[better]
+        best_j[better] = start + j[better]
+    return reps, best_j, best_d
+
+
+def mutual_reachability_mst(
+    X: np.ndarray, indices: np.ndarray, distances: np.ndarray, min_samples: int, metric: str
+) -> np.ndarray:
+    """HDBSCAN's minimum spanning tree (rows: i, j, weight; sorted by weight) restricted to kNN edges.
+
+    core distance = distance to the `min_samples`-th neighbour not counting the row itself, as in hdbscan.
+    Components the kNN edges leave disconnected (e.g. islands of duplicate texts) are joined through
+    exact nearest-row links, so the tree always spans all rows.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+
+    n, k = indices.shape
+    if min_samples >= k:
+        raise ValueError(f"min_samples={min_samples} needs a kNN graph with k > {min_samples} (have {k})")
+    core = distances[:, min_samples].astype(np.float64)
+    rows = np.repeat(np.arange(n, dtype=np.int64), k - 1)
+    cols = indices[:, 1:].astype(np.int64).ravel()
+    d = distances[:, 1:].astype(np.float64).ravel()
+    ok = cols >= 0
+    rows, cols, d = rows[ok], cols[ok], d[ok]
+    # Explicit zeros are not edges in scipy's sparse graphs; duplicates really are at distance 0.
+    tiny = np.finfo(np.float64).tiny
+
+    def graph(rows, cols, d):
+        w = np.maximum(np.maximum(core[rows], core[cols]), d)
+        lo, hi = np.minimum(rows, cols), np.maximum(rows, cols)
+        keep = lo != hi
+        key, first = np.unique(lo[keep] * n + hi[keep], return_index=True)
+        w = w[keep][first]
+        return coo_matrix((np.maximum(w, tiny), (key // n, key % n)), shape=(n, n)).tocsr()
+
+    G = graph(rows, cols, d)
+    n_comp, comp = connected_components(G, directed=False)
+    while n_comp > 1:
+        a, b, dab = _component_links(X, comp, n_comp, metric)
+        rows, cols, d = np.concatenate([rows, a]), np.concatenate([cols, b]), np.concatenate([d, dab])
+        G = graph(rows, cols, d)
+        n_comp, comp = connected_components(G, directed=False)
+
+    T = minimum_spanning_tree(G).tocoo()
+    mst = np.vstack([T.row.astype(np.float64), T.col.astype(np.float64), T.data.astype(np.float64)]).T
+    mst[mst[:, 2] <= tiny, 2] = 0.0
+    return mst[np.argsort(mst[:, 2], kind="mergesort")]
+
+
+def knn_hierarchy(X: np.ndarray, graph: KnnGraph, hcfg: dict) -> tuple[np.ndarray, np.ndarray] | None:
+    """(mutual-reachability MST, single-linkage tree) for hcfg's min_samples / metric from the shared graph.
+
+    None when the graph cannot stand in for hcfg's metric or has too few neighbours.
+    """
+    from hdbscan._hdbscan_linkage import label
+
+    metric = str(hcfg.get("metric", "euclidean"))
+    min_samples = int(hcfg["min_samples"])
+    dist = graph.distances_as(metric, is_unit_norm(X)) if metric in KNN_METRICS else None
+    if dist is None or graph.k <= min_samples:
+        return None
+    mst = mutual_reachability_mst(X, graph.indices, dist, min_samples, metric)
+    return mst, label(mst)
+
+
+def hdbscan_from_knn(X: np.ndarray, graph: KnnGraph, hcfg: dict) -> np.ndarray | None:
+    """HDBSCAN labels from the shared graph, or None when the graph cannot stand in for hcfg's metric."""
+    from hdbscan.hdbscan_ import _tree_to_labels
+
+    tree = knn_hierarchy(X, graph, hcfg)
+    if tree is None:
+        return None
+    labels, *_ = _tree_to_labels(None, tree[1], min_cluster_size=int(hcfg["min_cluster_size"]))
+    return labels
+
+
+def main():
+    import argparse
+
+    from pipeline_session import PipelineSession, load_cfg
+
+    ap = argparse.ArgumentParser(description="Build the shared kNN graph used by UMAP and HDBSCAN")
+    ap.add_argument("--config", required=True)
+    args = ap.parse_args()
+    PipelineSession(load_cfg(args.config)).knn()
+
+
+if __name__ == "__main__":
+    main()
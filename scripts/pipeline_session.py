@@ -0,0 +1,564 @@
+from __future__ import annotations
+
+import argparse
+import os
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from embedding_store import embedding_path, load_embeddings
+
+# embed -> knn -> umap -> cluster, plus axis_embed (embedding projection) after embed.
+SESSION_STAGES = ("embed", "knn", "umap", "cluster", "axis_embed")
+
+
+def load_cfg(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def ensure_dir(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def choose_color_column(df: pd.DataFrame, priority: list[str]) -> str | None:
+    for c in priority:
+        if c in df.columns:
+            return c
+    return None
+
+
+def umap_reducer(X: np.ndarray, ucfg: dict, knn=None):
+    import umap
+
+    n_neighbors = int(ucfg["n_neighbors"])
+    metric = str(ucfg["metric"])
+    precomputed = (None, None, None)
+    if knn is not None:
+        from knn_graph import is_unit_norm
+
+        dist = knn.distances_as(metric, is_unit_norm(X))
+        if dist is not None and knn.k >= n_neighbors:
+            # umap only prunes a larger k itself above 4096 rows
+            precomputed = (knn.indices[:, :n_neighbors], dist[:, :n_neighbors], None)
+            print(f"[INFO] umap: using the shared kNN graph (k={knn.k}, metric={knn.metric})")
+        else:
+            print(f"[INFO] umap: kNN graph (k={knn.k}, metric={knn.metric}) does not fit umap settings; computing neighbours")
+
+    return umap.UMAP(
+        n_components=int(ucfg["n_components"]),
+        n_neighbors=n_neighbors,
+        min_dist=float(ucfg["min_dist"]),
+        metric=metric,
+        random_state=int(ucfg["random_state"]),
+        precomputed_knn=precomputed,
+    )
+
+
+def fit_umap(X: np.ndarray, ucfg: dict, knn=None) -> np.ndarray:
+    import warnings
+
+    reducer = umap_reducer(X, ucfg, knn=knn)
+    with warnings.catch_warnings():
+        # No NNDescent search index is kept with the graph, so umap warns that transform() is unavailable.
+        warnings.filterwarnings("ignore", message="precomputed_knn\\[2\\]")
+        return reducer.fit_transform(X)
+
+
+def plot_umap(out: pd.DataFrame, cfg: dict) -> str:
+    import matplotlib.pyplot as plt
+
+    figdir = cfg["paths"]["figures_dir"]
+    # Plot (論文向け：pdf)
+    os.makedirs(figdir, exist_ok=True)
+    try:
+        if cfg["plots"].get("japanese_font", False):
+            import japanize_matplotlib  # noqa: F401
+    except Exception:
+        pass
+
+    color_col = choose_color_column(out, cfg["plots"].get("color_by_priority", []))
+    plt.figure()
+    if color_col is None:
+        plt.scatter(out["umap_x"], out["umap_y"], s=8)
+        plt.title("UMAP of Tourism Text Embeddings")
+    else:
+        # カテゴリ色分け（凡例は多すぎる場合があるので後で調整）
+        cats = out[color_col].astype(str).fillna("NA")
+        for cat in sorted(cats.unique()):
+            m = (cats == cat)
+            plt.scatter(out.loc[m, "umap_x"], out.loc[m, "umap_y"], s=8, label=cat)
+        plt.title(f"UMAP colored by {color_col}")
+        if len(cats.unique()) <= 12:
+            plt.legend(markerscale=2, fontsize=8)
+
+    plt.xlabel("UMAP-1")
+    plt.ylabel("UMAP-2")
+    fmt = cfg["plots"].get("format", "pdf")
+    dpi = int(cfg["plots"].get("dpi", 300))
+    figpath = os.path.join(figdir, f"umap_2d.{fmt}")
+    plt.savefig(figpath, dpi=dpi, bbox_inches="tight")
+    plt.close()
+    return figpath
+
+
+def cluster_labels(X: np.ndarray, ccfg: dict, knn=None) -> tuple[np.ndarray, dict[str, Any], list[dict[str, Any]]]:
+    """(labels, summary info, per-candidate report rows; empty when there is no model selection)."""
+    method = ccfg["method"]
+    labels = None
+    info: dict[str, Any] = {}
+    report: list[dict[str, Any]] = []
+
+    if method == "hdbscan":
+        hcfg = ccfg["hdbscan"]
+        if hcfg.get("sweep"):
+            from hdbscan_sweep import sweep_hdbscan
+
+            labels, info, report = sweep_hdbscan(X, hcfg, knn=knn)
+            return labels, info, report
+        if knn is not None:
+            from knn_graph import hdbscan_from_knn
+
+            labels = hdbscan_from_knn(X, knn, hcfg)
+            if labels is None:
+                print(f"[INFO] hdbscan: kNN graph (k={knn.k}, metric={knn.metric}) does not fit hdbscan settings")
+            else:
+                info["knn_graph"] = True
+        if labels is None:
+            import hdbscan
+
+            from hdbscan_sweep import hdbscan_params
+
+            labels = hdbscan.HDBSCAN(**hdbscan_params(hcfg)).fit_predict(X)
+        info["n_clusters"] = int(len(set(labels)) - (1 if -1 in labels else 0))
+        info["n_noise"] = int((labels == -1).sum())
+
+    elif method == "kmeans":
+        from kmeans_select import select_kmeans
+
+        labels, info, report = select_kmeans(X, ccfg["kmeans"])
+
+    else:
+        raise ValueError(f"unknown cluster.method: {method}")
+
+    return labels, info, report
+
+
+def cluster_report_path(cfg: dict) -> str:
+    """Per-candidate report of cluster.method's model selection (k for kmeans, min_cluster_size sweep for hdbscan)."""
+    if cfg["cluster"]["method"] == "kmeans":
+        from kmeans_select import kmeans_report_path
+
+        return kmeans_report_path(cfg)
+    from hdbscan_sweep import hdbscan_report_path
+
+    return hdbscan_report_path(cfg)
+
+
+class PipelineSession:
+    """embed -> kNN graph -> umap -> cluster -> axis scoring in one process.
+
+    Artifacts stay on the session (`frame`, `X`, `umap_frame`, `cluster_frame`, `axis_frame`) and are
+    handed to the next stage directly; a stage that needs something not produced in this session
+    loads it from the usual path. `persist` (True / False / iterable of stage names) controls which
+    stages also write their outputs, to the same files as the scripts.
+    """
+
+    def __init__(self, cfg: dict, persist: bool | Iterable[str] = True):
+        self.cfg = cfg
+        if persist is True:
+            self.persist = set(SESSION_STAGES)
+        elif persist is False:
+            self.persist = set()
+        else:
+            self.persist = set(persist)
+        self._frame: pd.DataFrame | None = None
+        self._X: np.ndarray | None = None
+        self._knn = None
+        self._knn_loaded = False
+        self._umap_frame: pd.DataFrame | None = None
+        self._cluster_X: np.ndarray | None = None
+        self.cluster_frame: pd.DataFrame | None = None
+        self.cluster_info: dict[str, Any] = {}
+        self.cluster_report: list[dict[str, Any]] = []
+        self.axis_frame: pd.DataFrame | None = None
+        self.anchors: dict[str, Any] | None = None
+        self.axis_projection = None
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Cleaned text + meta columns, one row per embedding (data/processed/cleaned.csv)."""
+        if self._frame is None:
+            self._frame = pd.read_csv(self.cfg["paths"]["processed_csv"])
+        return self._frame
+
+    @property
+    def X(self) -> np.ndarray:
+        if self._X is None:
+            self._X = load_embeddings(embedding_path(self.cfg))
+        return self._X
+
+    @property
+    def knn_graph(self):
+        """Shared kNN graph (knn_graph.KnnGraph) or None when disabled, not built, or stale."""
+        if not self._knn_loaded:
+            from knn_graph import knn_enabled, knn_graph_path, load_knn_graph
+
+            self._knn_loaded = True
+            if knn_enabled(self.cfg):
+                self._knn = load_knn_graph(knn_graph_path(self.cfg), self.X)
+                if self._knn is None:
+                    print(f"[INFO] no kNN graph at {knn_graph_path(self.cfg)}; neighbours are computed per stage")
+        return self._knn
+
+    @property
+    def umap_frame(self) -> pd.DataFrame:
+        if self._umap_frame is None:
+            self._umap_frame = pd.read_csv(self.cfg["paths"]["umap_csv"])
+        return self._umap_frame
+
+    def embed(self) -> "PipelineSession":
+        from embedding_pipeline import run_embedding
+
+        self._frame, self._X = run_embedding(self.cfg, persist="embed" in self.persist)
+        return self
+
+    def knn(self) -> "PipelineSession":
+        from knn_graph import build_knn_graph, knn_enabled, knn_graph_path, save_knn_graph
+
+        if not knn_enabled(self.cfg):
+            print("[INFO] knn.enabled is false; umap and hdbscan compute their own neighbours")
+            return self
+        graph = build_knn_graph(self.X, self.cfg.get("knn") or {})
+        self._knn, self._knn_loaded = graph, True
+        if "knn" in self.persist and knn_graph_path(self.cfg):
+            save_knn_graph(knn_graph_path(self.cfg), graph, self.X)
+            print(f"[OK] saved kNN graph: {knn_graph_path(self.cfg)} k={graph.k} metric={graph.metric}")
+        else:
+            print(f"[OK] kNN graph in memory: k={graph.k} metric={graph.metric}")
+        return self
+
+    def umap(self, refit: bool = False) -> "PipelineSession":
+        if str(self.cfg["umap"].get("mode", "refit")) == "incremental":
+            return self._umap_incremental(refit)
+        Z = fit_umap(self.X, self.cfg["umap"], knn=self.knn_graph)
+        out = self.frame.copy()
+        out["umap_x"] = Z[:, 0]
+        out["umap_y"] = Z[:, 1]
+        self._write_umap(out)
+        return self
+
+    def _write_umap(self, out: pd.DataFrame) -> None:
+        self._umap_frame = out
+        if "umap" in self.persist:
+            umap_csv = self.cfg["paths"]["umap_csv"]
+            ensure_dir(umap_csv)
+            out.to_csv(umap_csv, index=False)
+            figpath = plot_umap(out, self.cfg)
+            print(f"[OK] saved: {umap_csv}")
+            print(f"[OK] saved figure: {figpath}")
+        else:
+            print(f"[OK] umap in memory: rows={len(out)}")
+
+    def _umap_incremental(self, refit: bool) -> "PipelineSession":
+        """Transform only the rows appended since the saved model; full fit when the model cannot be extended."""
+        from knn_graph import embedding_fingerprint
+        from umap_model import (
+            fitted_state,
+            load_umap_model,
+            load_umap_state,
+            new_rows_drift,
+            refit_reason,
+            save_umap_model,
+            umap_model_path,
+            write_umap_state,
+        )
+
+        ucfg = self.cfg["umap"]
+        umap_csv = self.cfg["paths"]["umap_csv"]
+        model_path = umap_model_path(self.cfg)
+        X, frame = self.X, self.frame
+        state = load_umap_state(model_path)
+        prev = pd.read_csv(umap_csv) if os.path.exists(umap_csv) else None
+
+        if refit:
+            reason = "requested"
+        elif prev is not None and list(prev.columns) != [*frame.columns, "umap_x", "umap_y"]:
+            reason = "umap_csv columns differ from the cleaned data"
+        else:
+            reason = refit_reason(state, ucfg, X, None if prev is None else len(prev))
+        if reason is None and int(state["n_rows"]) == len(X):
+            self._umap_frame = prev
+            print(f"[OK] umap up to date: rows={len(prev)} (no new rows)")
+            return self
+
+        drift = None
+        if reason is None:
+            reducer = load_umap_model(model_path)
+            n_rows = int(state["n_rows"])
+            X_new = np.asarray(X[n_rows:], dtype=np.float32)
+            drift = new_rows_drift(reducer, X_new, int(ucfg["n_neighbors"]), float(state["ref_knn_dist"]))
+            limit = float(ucfg.get("refit_drift", 1.5))
+            if drift > limit:
+                reason = f"new rows drift {drift:.2f} > refit_drift={limit}"
+
+        if reason is not None:
+            print(f"[INFO] umap: full fit ({reason})")
+            # umap's own neighbour search: transform() needs its NN-descent index, which the shared graph lacks
+            reducer = umap_reducer(X, ucfg)
+            Z = reducer.fit_transform(X)
+            out = frame.copy()
+            out["umap_x"] = Z[:, 0]
+            out["umap_y"] = Z[:, 1]
+            self._write_umap(out)
+            if "umap" in self.persist:
+                save_umap_model(model_path, reducer)
+                write_umap_state(model_path, fitted_state(ucfg, reducer, X))
+                print(f"[OK] saved umap model: {model_path}")
+            return self
+
+        Z_new = reducer.transform(X_new)
+        new = frame.iloc[n_rows:].copy()
+        new["umap_x"] = Z_new[:, 0]
+        new["umap_y"] = Z_new[:, 1]
+        out = pd.concat([prev, new], ignore_index=True)
+        self._umap_frame = out
+        if "umap" in self.persist:
+            new.to_csv(umap_csv, mode="a", header=False, index=False)
+            figpath = plot_umap(out, self.cfg)
+            state.update(n_rows=len(X), prefix_fingerprint=embedding_fingerprint(X), last_drift=drift)
+            write_umap_state(model_path, state)
+            print(f"[OK] appended {len(new)} rows: {umap_csv}")
+            print(f"[OK] saved figure: {figpath}")
+        print(f"[OK] umap: transformed {len(new)} new rows (drift={drift:.2f}) into the saved layout; rows={len(out)}")
+        return self
+
+    def cluster_space(self) -> tuple[np.ndarray, Any]:
+        """(matrix the clusterer runs on, kNN graph over it): X and the shared graph, or the cluster.reduce projection.
+
+        The projection is loaded from cluster.reduce.path when it was saved for these embeddings and settings.
+        """
+        from cluster_space import cluster_space_path, load_cluster_space, reduce_embeddings, reduce_enabled, save_cluster_space
+
+        if not reduce_enabled(self.cfg):
+            return self.X, self.knn_graph
+        if self._cluster_X is None:
+            rcfg = self.cfg["cluster"]["reduce"]
+            path = cluster_space_path(self.cfg)
+            Z = load_cluster_space(path, self.X, rcfg)
+            if Z is not None:
+                print(f"[OK] loaded cluster space: {path} shape={Z.shape}")
+            else:
+                Z = reduce_embeddings(self.X, rcfg, knn=self.knn_graph)
+                if "cluster" in self.persist:
+                    save_cluster_space(path, Z, self.X, rcfg)
+                    print(f"[OK] saved cluster space: {path} method={rcfg['method']} shape={Z.shape}")
+                else:
+                    print(f"[OK] cluster space in memory: method={rcfg['method']} shape={Z.shape}")
+            self._cluster_X = Z
+        # the shared graph holds full-dimensional neighbours; the reduced space gets its own tree search
+        return self._cluster_X, None
+
+    def cluster(self, recluster: bool = False, assign_only: bool = False) -> "PipelineSession":
+        if assign_only or str(self.cfg["cluster"].get("mode", "refit")) == "incremental":
+            return self._cluster_incremental(recluster)
+        Xc, knn = self.cluster_space()
+        labels, info, report = cluster_labels(Xc, self.cfg["cluster"], knn=knn)
+        if Xc is not self.X:
+            info["reduced"] = f"{self.cfg['cluster']['reduce']['method']}:{Xc.shape[1]}"
+        df = self.umap_frame.copy()
+        df["cluster"] = labels.astype(int)
+        self._write_clusters(df, info, report)
+        return self
+
+    def _write_clusters(self, df: pd.DataFrame, info: dict[str, Any], report: list[dict[str, Any]]) -> None:
+        self.cluster_frame, self.cluster_info, self.cluster_report = df, info, report
+        if "cluster" in self.persist:
+            out_csv = self.cfg["paths"]["cluster_csv"]
+            ensure_dir(out_csv)
+            df.to_csv(out_csv, index=False)
+            print(f"[OK] saved clusters: {out_csv}")
+            if report:
+                report_csv = cluster_report_path(self.cfg)
+                pd.DataFrame(report).to_csv(report_csv, index=False)
+                print(f"[OK] saved selection report: {report_csv}")
+        print(f"[INFO] method={self.cfg['cluster']['method']} info={info}")
+
+    def _cluster_incremental(self, recluster: bool) -> "PipelineSession":
+        """Label only the rows appended since the saved clusterer; full fit when it cannot be extended."""
+        from cluster_model import (
+            assign_clusters,
+            cluster_model_path,
+            cluster_params,
+            fit_clusterer,
+            load_cluster_model,
+            load_cluster_state,
+            new_rows_drift,
+            recluster_reason,
+            reference_knn_distance,
+            reference_rows,
+            save_cluster_model,
+            write_cluster_state,
+        )
+        from cluster_space import make_reducer, reduce_enabled
+        from knn_graph import embedding_fingerprint
+
+        ccfg = self.cfg["cluster"]
+        out_csv = self.cfg["paths"]["cluster_csv"]
+        model_path = cluster_model_path(self.cfg)
+        X, frame = self.X, self.umap_frame
+        if len(frame) != len(X):
+            raise SystemExit(f"[ERROR] umap_csv has {len(frame)} rows but there are {len(X)} embeddings; run the umap stage first")
+        state = load_cluster_state(model_path)
+        prev = pd.read_csv(out_csv) if os.path.exists(out_csv) else None
+
+        if recluster:
+            reason = "requested"
+        elif prev is not None and list(prev.columns) != [*frame.columns, "cluster", "cluster_strength"]:
+            reason = "cluster_csv columns differ from umap_csv"
+        else:
+            reason = recluster_reason(state, ccfg, X, None if prev is None else len(prev))
+        if reason is None and int(state["n_rows"]) == len(X):
+            self.cluster_frame = prev
+            print(f"[OK] clusters up to date: rows={len(prev)} (no new rows)")
+            return self
+
+        drift = None
+        if reason is None:
+            bundle = load_cluster_model(model_path)
+            n_rows = int(state["n_rows"])
+            X_new = np.asarray(X[n_rows:], dtype=np.float32)
+            Xc_new = bundle["reducer"].transform(X_new) if bundle["reducer"] is not None else X_new
+            drift = new_rows_drift(bundle["reference"], X_new, float(state["ref_knn_dist"]))
+            limit = float(ccfg.get("recluster_drift", 1.5))
+            if drift > limit:
+                reason = f"new rows drift {drift:.2f} > recluster_drift={limit}"
+
+        if reason is not None:
+            print(f"[INFO] cluster: full fit ({reason}); cluster ids are renumbered")
+            reducer, Xc = None, X
+            if reduce_enabled(self.cfg):
+                # umap's own neighbour search: transform() needs its NN-descent index, which the shared graph lacks
+                reducer = make_reducer(X, ccfg["reduce"])
+                Xc = np.asarray(reducer.fit_transform(np.asarray(X, dtype=np.float32)), dtype=np.float32)
+            labels, strengths, info, report, model = fit_clusterer(Xc, ccfg, knn=self.knn_graph if reducer is None else None)
+            df = frame.copy()
+            df["cluster"] = labels.astype(int)
+            df["cluster_strength"] = strengths
+            self._write_clusters(df, info, report)
+            if "cluster" in self.persist:
+                ref = reference_rows(X)
+                save_cluster_model(model_path, {"reducer": reducer, "model": model, "reference": ref})
+                write_cluster_state(
+                    model_path,
+                    {
+                        "params": cluster_params(ccfg),
+                        "n_fit": len(X),
+                        "n_rows": len(X),
+                        "prefix_fingerprint": embedding_fingerprint(X),
+                        "ref_knn_dist": reference_knn_distance(ref),
+                    },
+                )
+                print(f"[OK] saved cluster model: {model_path}")
+            return self
+
+        labels, strengths = assign_clusters(bundle, Xc_new, ccfg["method"])
+        new = frame.iloc[n_rows:].copy()
+        new["cluster"] = labels.astype(int)
+        new["cluster_strength"] = strengths
+        out = pd.concat([prev, new], ignore_index=True)
+        self.cluster_frame, self.cluster_report = out, []
+        self.cluster_info = {"assigned": len(new), "new_noise": int((labels == -1).sum()), "drift": round(drift, 3)}
+        if "cluster" in self.persist:
+            new.to_csv(out_csv, mode="a", header=False, index=False)
+            state.update(n_rows=len(X), prefix_fingerprint=embedding_fingerprint(X), last_drift=drift)
+            write_cluster_state(model_path, state)
+            print(f"[OK] appended {len(new)} rows: {out_csv}")
+        print(f"[OK] cluster: assigned {len(new)} new rows (drift={drift:.2f}) to the saved clusters; rows={len(out)}")
+        return self
+
+    def axis_embed(
+        self,
+        axis_config: str = "config/axis_scoring.yaml",
+        input_csv: str = "outputs/axis_scores/axis_scores.csv",
+        output_csv: str = "outputs/axis_scores/axis_scores.csv",
+        anchors_json: str = "outputs/axis_scores/embedding_anchors.json",
+        axes_npz: str = "outputs/axis_scores/embedding_axes.npz",
+        output_parquet: str = "",
+        anchors_k: int = 6,
+        dict_workers: int = 1,
+        dict_chunk_size: int = 2000,
+    ) -> "PipelineSession":
+        """Embedding-projection axis scores (11_axis_score_embedding) using this session's matrix."""
+        from axis_embedding import load_axis_frame, save_axis_outputs, score_embedding_axes
+        from axis_scoring import load_axis_config
+
+        text_col = self.cfg["text"]["text_column"]
+        axes_spec, dict_cfg, weights = load_axis_config(axis_config)
+        df, row_ids = load_axis_frame(input_csv, self.cfg["paths"]["input_csv"], text_col)
+        anchors, dict_computed, projection = score_embedding_axes(
+            df,
+            self.X,
+            axes_spec,
+            dict_cfg,
+            weights,
+            text_col,
+            anchors_k=anchors_k,
+            dict_workers=dict_workers,
+            dict_chunk_size=dict_chunk_size,
+        )
+        self.axis_frame, self.anchors, self.axis_projection = df, anchors, projection
+        if "axis_embed" in self.persist:
+            save_axis_outputs(
+                df,
+                anchors,
+                [a.id for a in axes_spec],
+                output_csv,
+                anchors_json,
+                output_parquet=output_parquet,
+                row_ids=row_ids,
+                dict_computed=dict_computed,
+                projection=projection,
+                axes_npz=axes_npz,
+                X=self.X,
+            )
+        else:
+            print(f"[OK] axis scores in memory: rows={len(df)} axes={len(axes_spec)}")
+        return self
+
+    def run(self, stages: Iterable[str] = SESSION_STAGES) -> "PipelineSession":
+        stages = list(stages)
+        unknown = [s for s in stages if s not in SESSION_STAGES]
+        if unknown:
+            raise ValueError(f"unknown stage(s): {', '.join(unknown)}")
+        for name in SESSION_STAGES:
+            if name in stages:
+                getattr(self, name)()
+        return self
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run embed -> knn -> umap -> cluster -> axis_embed in one process")
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--stages", default=",".join(SESSION_STAGES), help="Comma-separated subset of stages")
+    ap.add_argument(
+        "--persist",
+        default="all",
+        help="Stages whose outputs are written to disk: all, none, or a comma-separated list",
+    )
+    args = ap.parse_args()
+
+    if args.persist == "all":
+        persist: bool | set[str] = True
+    elif args.persist == "none":
+        persist = False
+    else:
+        persist = {s.strip() for s in args.persist.split(",") if s.strip()}
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    PipelineSession(load_cfg(args.config), persist=persist).run(stages)
+
+
+if __name__ == "__main__":
+    main()
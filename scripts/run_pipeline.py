@@ -0,0 +1,409 @@
+import argparse
+import concurrent.futures
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any
+
+import yaml
+
+from embedding_store import embedding_path, meta_path, scale_path
+from cluster_model import cluster_model_path
+from cluster_space import cluster_space_path, reduce_enabled
+from hdbscan_sweep import hdbscan_report_path
+from kmeans_select import kmeans_report_path
+from knn_graph import knn_enabled, knn_graph_path
+from umap_model import umap_model_path
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_cfg(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+@dataclasses.dataclass
+class Stage:
+    """One pipeline step. Dependencies are the stages that produce any of `inputs` (plus `after`)."""
+
+    name: str
+    argv: list[str]
+    inputs: list[str]
+    outputs: list[str]
+    config_keys: list[str]
+    sources: list[str]
+    after: list[str] = dataclasses.field(default_factory=list)
+
+
+def _script(name: str) -> str:
+    return os.path.join(SCRIPTS_DIR, name)
+
+
+def pipeline_stages(cfg: dict, cfg_path: str, axis_config: str = "config/axis_scoring.yaml") -> list[Stage]:
+    p = cfg["paths"]
+    emb = embedding_path(cfg)
+    emb_files = [emb, meta_path(emb)]
+    if emb.endswith(".npy") and str(cfg["embedding"].get("storage_dtype", "float32")) == "int8":
+        emb_files.append(scale_path(emb))
+    axis_csv = "outputs/axis_scores/axis_scores.csv"
+    fig = os.path.join(p["figures_dir"], f"umap_2d.{cfg.get('plots', {}).get('format', 'pdf')}")
+    py = sys.executable
+    emb_sources = [
+        "01_embed.py",
+        "embedding_pipeline.py",
+        "pipeline_session.py",
+        "embedding_backends.py",
+        "embedding_cache.py",
+        "embedding_store.py",
+        "axis_scoring.py",
+    ]
+    umap_model_files = []
+    if str(cfg["umap"].get("mode", "refit")) == "incremental":
+        umap_model_files = [umap_model_path(cfg), umap_model_path(cfg) + ".meta.json"]
+    cluster_files = []
+    if cfg["cluster"]["method"] == "kmeans":
+        cluster_files = [kmeans_report_path(cfg)]
+    elif (cfg["cluster"].get("hdbscan") or {}).get("sweep"):
+        cluster_files = [hdbscan_report_path(cfg)]
+    if str(cfg["cluster"].get("mode", "refit")) == "incremental":
+        cluster_files += [cluster_model_path(cfg), cluster_model_path(cfg) + ".meta.json"]
+    elif reduce_enabled(cfg):
+        cluster_files += [cluster_space_path(cfg), cluster_space_path(cfg) + ".meta.json"]
+    # Shared kNN graph (knn.enabled): umap and cluster read it, so they depend on the knn stage.
+    knn_files = [knn_graph_path(cfg), knn_graph_path(cfg) + ".meta.json"] if knn_enabled(cfg) else []
+    knn_stage = [
+        Stage(
+            name="knn",
+            argv=[py, _script("knn_graph.py"), "--config", cfg_path],
+            inputs=[*emb_files],
+            outputs=knn_files,
+            config_keys=["knn", "paths.knn_graph"],
+            sources=["knn_graph.py", "pipeline_session.py", "embedding_store.py"],
+        )
+    ] if knn_files else []
+    return [
+        Stage(
+            name="validate",
+            argv=[py, _script("00_validate_input.py"), "--config", cfg_path],
+            inputs=[p["input_csv"]],
+            outputs=[p["validation_report"]] if p.get("validation_report") else [],
+            config_keys=["text", "validation", "paths.input_csv", "paths.validation_report"],
+            sources=["00_validate_input.py", "embedding_pipeline.py", "axis_scoring.py"],
+        ),
+        Stage(
+            name="embed",
+            argv=[py, _script("01_embed.py"), "--config", cfg_path],
+            inputs=[p["input_csv"]],
+            outputs=[p["processed_csv"], *emb_files],
+            config_keys=[
+                "project.seed",
+                "text",
+                "embedding",
+                "paths.input_csv",
+                "paths.processed_csv",
+                "paths.embedding_npz",
+                "paths.embedding_npy",
+            ],
+            sources=emb_sources,
+            after=["validate"],
+        ),
+        *knn_stage,
+        Stage(
+            name="umap",
+            argv=[py, _script("02_umap.py"), "--config", cfg_path],
+            inputs=[p["processed_csv"], *emb_files, *knn_files],
+            outputs=[p["umap_csv"], fig, *umap_model_files],
+            config_keys=["umap", "plots", "knn.enabled", "paths.umap_csv", "paths.figures_dir"],
+            sources=["02_umap.py", "pipeline_session.py", "umap_model.py", "knn_graph.py", "embedding_store.py"],
+        ),
+        Stage(
+            name="cluster",
+            argv=[py, _script("03_cluster.py"), "--config", cfg_path],
+            inputs=[p["umap_csv"], *emb_files, *knn_files],
+            outputs=[p["cluster_csv"], *cluster_files],
+            config_keys=["cluster", "knn.enabled", "paths.cluster_csv"],
+            sources=["03_cluster.py", "pipeline_session.py", "knn_graph.py", "cluster_space.py", "cluster_model.py", "kmeans_select.py", "hdbscan_sweep.py", "embedding_store.py"],
+        ),
+        Stage(
+            # Same call as `make axis_embed`; judge scores (if any) are picked up from the CSV but,
+            # since they need an API key, the judge itself is not part of the pipeline. The CSV is an
+            # input too, so a judge run that rewrote it makes this stage stale.
+            name="axis_embed",
+            argv=[
+                py,
+                _script("11_axis_score_embedding.py"),
+                "--axis-config",
+                axis_config,
+                "--input-csv",
+                axis_csv,
+                "--raw-input-csv",
+                p["input_csv"],
+                "--text-col",
+                str(cfg["text"]["text_column"]),
+                "--embeddings",
+                emb,
+                "--output-csv",
+                axis_csv,
+            ],
+            inputs=[axis_config, p["input_csv"], axis_csv, *emb_files],
+            outputs=[
+                axis_csv,
+                "outputs/axis_scores/embedding_anchors.json",
+                "outputs/axis_scores/embedding_axes.npz",
+                "outputs/axis_scores/embedding_axes.npz.meta.json",
+            ],
+            config_keys=["text.text_column"],
+            sources=[
+                "11_axis_score_embedding.py",
+                "axis_embedding.py",
+                "axis_scoring.py",
+                "axis_store.py",
+                "embedding_store.py",
+                "knn_graph.py",
+            ],
+        ),
+    ]
+
+
+class FileHasher:
+    """sha1 of file contents, memoized by (size, mtime_ns) across runs so large artifacts are read once."""
+
+    def __init__(self, memo: dict[str, Any] | None = None):
+        self.memo = memo or {}
+
+    def __call__(self, path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        hit = self.memo.get(key)
+        if hit and hit["size"] == st.st_size and hit["mtime_ns"] == st.st_mtime_ns:
+            return hit["sha1"]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self.memo[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": h.hexdigest()}
+        return h.hexdigest()
+
+
+def _config_value(cfg: dict, dotted: str) -> Any:
+    v: Any = cfg
+    for k in dotted.split("."):
+        if not isinstance(v, dict) or k not in v:
+            return None
+        v = v[k]
+    return v
+
+
+def stage_fingerprint(stage: Stage, cfg: dict, hasher: FileHasher) -> tuple[str, dict[str, Any]]:
+    parts = {
+        "argv": [os.path.basename(stage.argv[1]), *stage.argv[2:]],
+        "sources": {s: hasher(_script(s)) for s in stage.sources},
+        "inputs": {p: hasher(p) for p in stage.inputs},
+        "config": {k: _config_value(cfg, k) for k in stage.config_keys},
+    }
+    return _parts_hash(parts), parts
+
+
+def _parts_hash(parts: dict[str, Any]) -> str:
+    blob = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def resolve_dependencies(stages: list[Stage]) -> dict[str, set[str]]:
+    producers = {os.path.normpath(o): s.name for s in stages for o in s.outputs}
+    deps: dict[str, set[str]] = {}
+    names = {s.name for s in stages}
+    for s in stages:
+        d = {producers[os.path.normpath(i)] for i in s.inputs if os.path.normpath(i) in producers}
+        d |= {a for a in s.after if a in names}
+        d.discard(s.name)
+        deps[s.name] = d
+    return deps
+
+
+def select_stages(stages: list[Stage], wanted: list[str] | None) -> list[Stage]:
+    if not wanted:
+        return stages
+    by_name = {s.name: s for s in stages}
+    unknown = [w for w in wanted if w not in by_name]
+    if unknown:
+        raise SystemExit(f"unknown stage(s): {', '.join(unknown)} (available: {', '.join(by_name)})")
+    deps = resolve_dependencies(stages)
+    keep: set[str] = set()
+    todo = list(wanted)
+    while todo:
+        n = todo.pop()
+        if n not in keep:
+            keep.add(n)
+            todo.extend(deps[n])
+    return [s for s in stages if s.name in keep]
+
+
+def _load_json(path: str) -> dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json_atomic(path: str, obj: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _run_stage(stage: Stage, log_path: str) -> tuple[int, float]:
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    t0 = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        rc = subprocess.call(stage.argv, stdout=log, stderr=subprocess.STDOUT, env=env)
+    return rc, time.perf_counter() - t0
+
+
+def _tail(path: str, n: int = 20) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return "".join(f.readlines()[-n:])
+
+
+def run_pipeline(
+    cfg: dict,
+    cfg_path: str,
+    wanted: list[str] | None = None,
+    jobs: int = 2,
+    force: bool = False,
+    dry_run: bool = False,
+) -> dict[str, Any]:
+    """Run stale stages in dependency order, up to `jobs` at a time, and return the run manifest.
+
+    A stage is skipped when its fingerprint (script sources, input file hashes, its config keys) and
+    the hashes of its outputs match the previous successful run.
+    """
+    out_dir = cfg["paths"].get("pipeline_dir", "outputs/pipeline")
+    state_path = os.path.join(out_dir, "state.json")
+    state = _load_json(state_path)
+    hasher = FileHasher(state.get("file_hashes"))
+    stage_state: dict[str, Any] = state.get("stages", {})
+
+    all_stages = pipeline_stages(cfg, cfg_path)
+    stages = select_stages(all_stages, wanted)
+    deps = {n: d & {s.name for s in stages} for n, d in resolve_dependencies(stages).items()}
+    by_name = {s.name: s for s in stages}
+
+    run_id = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+    manifest: dict[str, Any] = {
+        "run_id": run_id,
+        "config": os.path.abspath(cfg_path),
+        "started_at": time.time(),
+        "jobs": jobs,
+        "stages": {},
+    }
+    done: dict[str, str] = {}  # name -> ran | skipped | would_run | failed | blocked
+    running: dict[concurrent.futures.Future, tuple[Stage, str, dict[str, Any]]] = {}
+
+    def _ready() -> list[Stage]:
+        in_flight = {v[0].name for v in running.values()}
+        return [
+            s
+            for s in stages
+            if s.name not in done and s.name not in in_flight and all(d in done for d in deps[s.name])
+        ]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(jobs))) as executor:
+        while len(done) < len(stages):
+            ready = _ready()
+            if not ready and not running:
+                raise RuntimeError(f"pipeline stalled (dependency cycle?): {sorted(set(by_name) - set(done))}")
+            for s in ready:
+                if any(done[d] in ("failed", "blocked") for d in deps[s.name]):
+                    done[s.name] = "blocked"
+                    manifest["stages"][s.name] = {"status": "blocked"}
+                    print(f"[INFO] {s.name}: blocked (upstream failed)")
+                    continue
+                fp, parts = stage_fingerprint(s, cfg, hasher)
+                prev = stage_state.get(s.name, {})
+                outputs_ok = all(hasher(o) is not None and hasher(o) == prev.get("outputs", {}).get(o) for o in s.outputs)
+                upstream_pending = any(done[d] == "would_run" for d in deps[s.name])
+                if not force and not upstream_pending and prev.get("fingerprint") == fp and outputs_ok:
+                    done[s.name] = "skipped"
+                    manifest["stages"][s.name] = {"status": "skipped", "fingerprint": fp, **parts, "outputs": prev.get("outputs", {})}
+                    print(f"[OK] {s.name}: up to date")
+                    continue
+                if dry_run:
+                    done[s.name] = "would_run"
+                    manifest["stages"][s.name] = {"status": "would_run", "fingerprint": fp, **parts}
+                    print(f"[INFO] {s.name}: would run")
+                    continue
+                log_path = os.path.join(out_dir, "logs", f"{s.name}.log")
+                print(f"[INFO] {s.name}: running {os.path.basename(s.argv[1])}")
+                running[executor.submit(_run_stage, s, log_path)] = (s, fp, parts)
+
+            if not running:
+                continue
+            finished, _ = concurrent.futures.wait(list(running), return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in finished:
+                s, fp, parts = running.pop(fut)
+                log_path = os.path.join(out_dir, "logs", f"{s.name}.log")
+                rc, secs = fut.result()
+                entry = {"fingerprint": fp, **parts, "seconds": round(secs, 3), "returncode": rc, "log": log_path}
+                if rc == 0:
+                    outputs = {o: hasher(o) for o in s.outputs}
+                    own = [i for i in s.inputs if i in outputs]
+                    if own:
+                        # An input the stage rewrites itself (axis_scores.csv) is recorded as written, so only
+                        # a change by another writer (the judge) makes the stage stale again.
+                        parts = {**parts, "inputs": {**parts["inputs"], **{i: outputs[i] for i in own}}}
+                        fp = _parts_hash(parts)
+                    entry.update(status="ran", outputs=outputs)
+                    stage_state[s.name] = {"fingerprint": fp, "outputs": outputs, "finished_at": time.time()}
+                    done[s.name] = "ran"
+                    print(f"[OK] {s.name}: done in {secs:.1f}s")
+                else:
+                    entry["status"] = "failed"
+                    stage_state.pop(s.name, None)
+                    done[s.name] = "failed"
+                    print(f"[ERROR] {s.name}: exit code {rc} (log: {log_path})\n{_tail(log_path)}", file=sys.stderr)
+                manifest["stages"][s.name] = entry
+
+    manifest["finished_at"] = time.time()
+    manifest["ok"] = not any(v in ("failed", "blocked") for v in done.values())
+    if not dry_run:
+        _write_json_atomic(state_path, {"stages": stage_state, "file_hashes": hasher.memo})
+        _write_json_atomic(os.path.join(out_dir, "manifests", f"{run_id}.json"), manifest)
+        _write_json_atomic(os.path.join(out_dir, "manifest.json"), manifest)
+    return manifest
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True)
+    ap.add_argument("--stages", default="", help="Comma-separated stages to bring up to date (default: all)")
+    ap.add_argument("--jobs", type=int, default=0, help="Stages run concurrently (default: pipeline.jobs)")
+    ap.add_argument("--force", action="store_true", help="Run the selected stages even if up to date")
+    ap.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    args = ap.parse_args()
+
+    cfg = load_cfg(args.config)
+    jobs = args.jobs or int(cfg.get("pipeline", {}).get("jobs", 2))
+    wanted = [s.strip() for s in args.stages.split(",") if s.strip()] or None
+    manifest = run_pipeline(cfg, args.config, wanted=wanted, jobs=jobs, force=args.force, dry_run=args.dry_run)
+    counts: dict[str, int] = {}
+    for v in manifest["stages"].values():
+        counts[v["status"]] = counts.get(v["status"], 0) + 1
+    print(f"[OK] pipeline {manifest['run_id']}: {counts}")
+    if not manifest["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+
+import numpy as np
+
+from knn_graph import embedding_fingerprint
+
+# umap.mode: incremental keeps the fitted reducer at umap.model_path (joblib) with a "<path>.meta.json" state:
+#   params               umap settings the model was fitted with (a change forces a refit)
+#   n_fit                rows the reducer was fitted on
+#   n_rows               rows currently in umap_csv (fitted + transformed since)
+#   prefix_fingerprint   embedding_fingerprint(X[:n_rows]); new rows are only ever appended
+#   ref_knn_dist         median distance of fitted rows to their k-th nearest fitted neighbour
+# New rows are projected with reducer.transform() and appended to umap_csv. A full refit happens when
+# the rows added since the fit exceed `refit_new_fraction` of n_fit, or when the new rows sit further
+# from the fitted data than `refit_drift` x ref_knn_dist (median k-th neighbour distance).
+UMAP_PARAMS = ("n_components", "n_neighbors", "min_dist", "metric", "random_state")
+
+
+def umap_params(ucfg: dict) -> dict[str, Any]:
+    return {k: ucfg.get(k) for k in UMAP_PARAMS}
+
+
+def umap_model_path(cfg: dict) -> str:
+    return str(cfg["umap"].get("model_path") or os.path.join(os.path.dirname(cfg["paths"]["umap_csv"]), "umap_model.joblib"))
+
+
+def _state_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def load_umap_state(path: str) -> dict[str, Any] | None:
+    if not os.path.exists(path) or not os.path.exists(_state_path(path)):
+        return None
+    with open(_state_path(path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_umap_state(path: str, state: dict[str, Any]) -> None:
+    tmp = _state_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _state_path(path))
+
+
+def save_umap_model(path: str, reducer) -> None:
+    import joblib
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    joblib.dump(reducer, tmp)
+    os.replace(tmp, path)
+
+
+def load_umap_model(path: str):
+    import joblib
+
+    return joblib.load(path)
+
+
+def kth_neighbour_distance(reducer, Xq: np.ndarray, k: int) -> np.ndarray:
+    """Distance from each query row to its k-th nearest row of the reducer's training data."""
+    Xq = np.asarray(Xq, dtype=np.float32)
+    index = getattr(reducer, "_knn_search_index", None)
+    if index is not None:
+        _, d = index.query(Xq, k=k)
+    else:
+        # small data: umap itself used exact pairwise distances
+        from sklearn.neighbors import NearestNeighbors
+
+        nn = NearestNeighbors(n_neighbors=k, metric=reducer.metric, algorithm="brute").fit(reducer._raw_data)
+        d, _ = nn.kneighbors(Xq)
+    return np.asarray(d, dtype=np.float64)[:, k - 1]
+
+
+def reference_knn_distance(reducer, X: np.ndarray, k: int, sample: int = 2000, seed: int = 0) -> float:
+    """Median k-th neighbour distance of fitted rows (k + 1 because each row finds itself first)."""
+    n = int(X.shape[0])
+    take = np.sort(np.random.default_rng(seed).choice(n, size=min(n, sample), replace=False))
+    d = kth_neighbour_distance(reducer, X[take], min(k + 1, n))
+    return float(np.median(d[np.isfinite(d)]))
+
+
+def new_rows_drift(reducer, X_new: np.ndarray, k: int, ref: float) -> float:
+    d = kth_neighbour_distance(reducer, X_new, k)
+    d = d[np.isfinite(d)]
+    if not len(d) or ref <= 0:
+        return float("inf")
+    return float(np.median(d) / ref)
+
+
+def fitted_state(ucfg: dict, reducer, X: np.ndarray) -> dict[str, Any]:
+    return {
+        "params": umap_params(ucfg),
+        "n_fit": int(X.shape[0]),
+        "n_rows": int(X.shape[0]),
+        "prefix_fingerprint": embedding_fingerprint(X),
+        "ref_knn_dist": reference_knn_distance(reducer, X, int(ucfg["n_neighbors"])),
+    }
+
+
+def refit_reason(state: dict[str, Any] | None, ucfg: dict, X: np.ndarray, csv_rows: int | None) -> str | None:
+    """Why the saved model cannot just be extended with the new rows (None: it can)."""
+    if state is None:
+        return "no saved model"
+    if state.get("params") != umap_params(ucfg):
+        return "umap settings changed"
+    n_rows = int(state["n_rows"])
+    if csv_rows != n_rows:
+        return "umap_csv does not match the saved model"
+    if n_rows > int(X.shape[0]) or embedding_fingerprint(X[:n_rows]) != state.get("prefix_fingerprint"):
+        return "existing embedding rows changed"
+    added = int(X.shape[0]) - int(state["n_fit"])
+    limit = float(ucfg.get("refit_new_fraction", 0.25))
+    if added > limit * int(state["n_fit"]):
+        return f"{added} rows added since the fit (> refit_new_fraction={limit})"
+    return None